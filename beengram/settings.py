@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/dev/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -46,7 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "main.middleware.PerformanceMiddleware",
+    "main.middleware.QueryCheckMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "main.middleware.replica_middleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -82,10 +86,40 @@ WSGI_APPLICATION = "beengram.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
+        # Not tracked; copy the sample data in sample.sqlite3 here to start
+        # with it. The tracked file itself would be rewritten by WAL mode.
         "NAME": BASE_DIR / "db.sqlite3",
+        # Keep connections open across requests instead of reconnecting.
+        "CONN_MAX_AGE": int(os.getenv("CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # Take the write lock when a transaction starts, so that the busy
+            # timeout applies instead of failing on a read-to-write upgrade.
+            "transaction_mode": "IMMEDIATE",
+        },
     }
 }
 
+# Read replicas, given as a comma separated list of SQLite files in
+# DATABASE_REPLICAS. Safe requests read from them through main.routers; keep
+# them up to date with `manage.py sync_replica`.
+DATABASE_REPLICAS = []
+for index, name in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICAS", "").split(","))
+):
+    alias = f"replica{index + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": name,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["main.routers.PrimaryReplicaRouter"]
+
+# Seconds a client keeps reading from the primary after one of its writes.
+REPLICA_PIN_SECONDS = 5
+
 AUTH_USER_MODEL = "main.User"
 
 # Password validation
@@ -132,6 +166,22 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
+# Part of every ETag of rendered pages; change it when a deploy changes
+# what unchanged data renders to.
+ETAG_VERSION = "1"
+
+# Serve MEDIA_URL from Django (main.views.MediaView) when no front proxy does.
+SERVE_MEDIA = DEBUG or os.getenv("SERVE_MEDIA", "") == "1"
+
+STORAGES = {
+    "default": {
+        "BACKEND": "main.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
 EMAIL_USE_TLS = True
@@ -140,6 +190,69 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 EMAIL_PORT = os.getenv("EMAIL_PORT")
 
+# Cache
+# https://docs.djangoproject.com/en/dev/topics/cache/
+#
+# Post cards, feed pages and the follow graph are invalidated by deleting
+# or bumping cache keys, so every web and worker process must share the
+# cache. The file based cache does for processes on one host; use Memcached
+# or Redis across hosts. LocMemCache is only correct with a single process.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv(
+            "CACHE_DIR", os.path.join(tempfile.gettempdir(), "beengram-cache")
+        ),
+    },
+}
+
+# Cache alias and lifetime (seconds) of the cached first page of the home
+# feeds, see main.feedcache.
+FEED_CACHE_ALIAS = "default"
+FEED_CACHE_TIMEOUT = 300
+
+# Cache alias and lifetime (seconds) of the followee and follower ids of
+# each user, see main.followgraph.
+FOLLOW_GRAPH_CACHE_ALIAS = "default"
+FOLLOW_GRAPH_CACHE_TIMEOUT = 3600
+
+# Serve the feed, search and like API with their async views. Only useful
+# when running under an ASGI server (beengram.asgi).
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "") == "1"
+
+# Request timing samples kept per URL name and process (main.perf), and
+# where and how often processes share them for the admin page and
+# `manage.py perf_stats`. Files of exited processes are removed and files
+# older than PERF_STATS_MAX_AGE seconds are ignored.
+PERF_STATS_SIZE = 1000
+PERF_STATS_DIR = os.path.join(tempfile.gettempdir(), "beengram-perf")
+PERF_STATS_FLUSH_INTERVAL = 10
+PERF_STATS_MAX_AGE = 3600
+
+# What main.querycheck does about N+1 query patterns (a statement shape
+# repeated QUERY_CHECK_REPEAT_THRESHOLD times in one request) and exceeded
+# view query budgets: "off", "warn" (log) or "strict" (raise). The test
+# runner always uses "strict".
+QUERY_CHECK = os.getenv("QUERY_CHECK", "warn" if DEBUG else "off")
+QUERY_CHECK_REPEAT_THRESHOLD = 3
+TEST_RUNNER = "main.querycheck.QueryCheckTestRunner"
+
+# Trending feed (main.trending): the half-life of a like's weight, the
+# decayed score a post needs to be listed, how often the compact_trending
+# job rescales scores and how long like events are kept (seconds).
+TRENDING_HALF_LIFE = 6 * 3600
+TRENDING_MIN_SCORE = 0.1
+TRENDING_COMPACT_INTERVAL = 24 * 3600
+TRENDING_EVENT_RETENTION = 14 * 24 * 3600
+
+# How many follow suggestions are stored per user, see main.suggestions.
+FOLLOW_SUGGESTIONS_SIZE = 20
+
+# Run background jobs right after the enqueuing transaction commits instead
+# of waiting for `manage.py run_worker`.
+JOBS_EAGER = False
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "index"
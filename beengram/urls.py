@@ -14,16 +14,29 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import re
+
 from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from main.admin import performance_view
+from main.views import MediaView
 
 urlpatterns = [
+    path(
+        "admin/performance/",
+        admin.site.admin_view(performance_view),
+        name="admin_performance",
+    ),
     path("admin/", admin.site.urls),
     path("", include("main.urls")),
 ]
 
-if settings.DEBUG:
-    from django.contrib.staticfiles.urls import static
-
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(
+            r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")),
+            MediaView.as_view(),
+        ),
+    ]
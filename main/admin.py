@@ -1,6 +1,24 @@
 from django.contrib import admin
+from django.template.response import TemplateResponse
 
+from . import perf
 from .models import Post, User
 
 admin.site.register(User)
 admin.site.register(Post)
+
+
+def performance_view(request):
+    """Request timing percentiles per URL name, for staff."""
+    percentiles = [f"p{p}" for p in perf.PERCENTILES]
+    rows = perf.summary()
+    for row in rows:
+        row["cells"] = [row[metric][p] for metric in perf.METRICS for p in percentiles]
+    context = {
+        **admin.site.each_context(request),
+        "title": "Performance",
+        "metrics": perf.METRICS,
+        "percentiles": percentiles,
+        "rows": rows,
+    }
+    return TemplateResponse(request, "admin/performance.html", context)
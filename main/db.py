@@ -0,0 +1,112 @@
+"""
+SQLite connection tuning.
+
+Every new SQLite connection is configured from ``SQLITE_PRAGMAS``, by
+default ``DEFAULT_PRAGMAS``: WAL journaling lets readers proceed while a
+write is in progress, ``synchronous=NORMAL`` only syncs at checkpoints
+(which is still corruption safe in WAL mode), and the busy timeout makes
+writers wait for the lock instead of failing at once. Writes that still hit
+``database is locked`` can be retried with ``retry_on_locked``.
+
+Benchmarks run against a scratch file with ``scratch_database()``.
+"""
+
+import functools
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+RETRY_ATTEMPTS = 5
+RETRY_DELAY = 0.05
+
+
+def pragmas():
+    return getattr(settings, "SQLITE_PRAGMAS", DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, pragmas())
+
+
+def is_locked(exc):
+    message = str(exc)
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retry_on_locked(func=None, *, attempts=RETRY_ATTEMPTS, delay=RETRY_DELAY):
+    """
+    Retry ``func`` with jittered exponential backoff when SQLite reports that
+    the database is locked.
+
+    Calls made inside an atomic block are not retried, since the enclosing
+    transaction has to be rolled back; the outermost decorated call retries
+    instead.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if (
+                        attempt == attempts - 1
+                        or not is_locked(exc)
+                        or any(
+                            connection.in_atomic_block
+                            for connection in connections.all(initialized_only=True)
+                        )
+                    ):
+                        raise
+                time.sleep(delay * 2**attempt * random.uniform(0.5, 1.5))
+
+        return wrapper
+
+    return decorator(func) if func else decorator
+
+
+@contextmanager
+def scratch_database(path, migrate=True, **overrides):
+    """
+    Point the default database at the SQLite file ``path``, with
+    ``overrides`` of its settings, for the duration of the block.
+
+    Like the test runner does for its test database, this changes the
+    settings dict that the connections of every thread are created from.
+    """
+    connections.close_all()
+    settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+    saved = dict(settings_dict)
+    settings_dict.update(overrides, NAME=path)
+    try:
+        if migrate:
+            call_command("migrate", verbosity=0)
+        yield
+    finally:
+        connections.close_all()
+        settings_dict.clear()
+        settings_dict.update(saved)
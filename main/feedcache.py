@@ -0,0 +1,45 @@
+"""
+Cache of the first page of the home feeds.
+
+Only the ordered post ids and the next-page cursor are cached: globally for
+the latest feed and per user for the follow feed. A hit therefore costs one
+bulk ``in_bulk()`` hydration instead of the feed query, and deleted posts
+simply drop out during hydration. Entries are invalidated when the feeds
+they mirror change. The cache alias is set by ``FEED_CACHE_ALIAS``, so any
+Django backend (local memory, file based, ...) can be used.
+"""
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+LATEST_KEY = "feed:latest"
+FOLLOW_KEY = "feed:follow:%s"
+
+
+def _cache():
+    return caches[getattr(settings, "FEED_CACHE_ALIAS", DEFAULT_CACHE_ALIAS)]
+
+
+def follow_key(user_id):
+    return FOLLOW_KEY % user_id
+
+
+def get(key, per_page):
+    """Return ``(post_ids, next_cursor)`` for the cached first page, or None."""
+    entry = _cache().get(key)
+    if entry is None or entry[0] != per_page:
+        return None
+    return entry[1], entry[2]
+
+
+def store(key, per_page, post_ids, next_cursor):
+    timeout = getattr(settings, "FEED_CACHE_TIMEOUT", 300)
+    _cache().set(key, (per_page, list(post_ids), next_cursor), timeout)
+
+
+def invalidate_latest():
+    _cache().delete(LATEST_KEY)
+
+
+def invalidate_follow(user_ids):
+    _cache().delete_many([follow_key(user_id) for user_id in user_ids])
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 
+from . import tasks
 from .models import Post, User
 
 
@@ -26,6 +27,13 @@ class PostForm(forms.ModelForm):
             ),
         }
 
+    def save(self, commit=True):
+        self.instance.status = Post.PROCESSING
+        post = super().save(commit)
+        if commit:
+            tasks.process_post_image.delay(post_id=post.pk)
+        return post
+
 
 class ProfileEditForm(forms.ModelForm):
     class Meta:
@@ -41,6 +49,30 @@ class ProfileEditForm(forms.ModelForm):
             "profile": forms.Textarea(attrs={"placeholder": "150字以内", "rows": 7}),
         }
 
+    def is_current_icon(self, upload):
+        """Whether ``upload`` has the bytes of the icon the user already has."""
+        current = self.initial.get("icon")
+        field = self.instance._meta.get_field("icon")
+        if not (upload and current) or not hasattr(field.storage, "content_name"):
+            return False
+        name = field.generate_filename(self.instance, upload.name)
+        return field.storage.content_name(name, upload) == current.name
+
+    def save(self, commit=True):
+        icon_changed = "icon" in self.changed_data
+        if icon_changed and self.is_current_icon(self.cleaned_data["icon"]):
+            # Saving it again would add a storage reference that nothing
+            # releases, since django_cleanup sees the name unchanged.
+            self.instance.icon = self.initial["icon"].name
+            icon_changed = False
+        if icon_changed:
+            # The old variants belong to the replaced file.
+            self.instance.icon_variants = {}
+        user = super().save(commit)
+        if commit and icon_changed:
+            tasks.process_user_icon.delay(user_id=user.pk)
+        return user
+
 
 class ConfirmForm(forms.Form):
     confirm = forms.BooleanField(required=True)
@@ -52,3 +84,11 @@ class SearchForm(forms.Form):
         required=True,
         widget=forms.TextInput(attrs={"placeholder": "検索"}),
     )
+
+
+class PostSearchForm(SearchForm):
+    order = forms.ChoiceField(
+        label="並び順",
+        required=False,
+        choices=(("date", "新着順"), ("rank", "関連度順")),
+    )
@@ -0,0 +1,52 @@
+"""
+Versioned keys for cached post card fragments.
+
+Every post and every author has a version number in the cache. Card
+fragments are cached under both versions, so bumping either one makes the
+old fragment unreachable; stale entries simply age out and nothing is ever
+flushed. Missing versions start from the current time in nanoseconds
+rather than zero, so an evicted version can never collide with fragments
+cached under an earlier one.
+"""
+
+import time
+
+from django.core.cache import cache
+
+POST_KEY = "card-version:post:%s"
+AUTHOR_KEY = "card-version:user:%s"
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_post(post_id):
+    _bump(POST_KEY % post_id)
+
+
+def bump_author(user_id):
+    _bump(AUTHOR_KEY % user_id)
+
+
+def attach_versions(posts):
+    """Set ``card_version`` on each post with a single cache round trip."""
+    keys = set()
+    for post in posts:
+        keys.add(POST_KEY % post.pk)
+        keys.add(AUTHOR_KEY % post.user_id)
+    versions = cache.get_many(keys)
+    for key in keys - versions.keys():
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        versions[key] = version
+    for post in posts:
+        post.card_version = "%s.%s" % (
+            versions[POST_KEY % post.pk],
+            versions[AUTHOR_KEY % post.user_id],
+        )
+    return posts
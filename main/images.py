@@ -0,0 +1,130 @@
+"""
+Resized and WebP derivatives of uploaded images.
+
+Derivatives are stored next to the original under deterministic names
+(``posts/cat.jpg`` -> ``posts/cat_640w.jpg`` and ``posts/cat_640w.webp``),
+so they can be located and deleted from the original name alone. What was
+actually generated is recorded on the model in a small JSON field, which
+lets templates build ``srcset`` attributes without touching the storage.
+"""
+
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+POST_WIDTHS = (320, 640, 960, 1440)
+POST_SIZES = "(max-width: 960px) 100vw, 960px"
+ICON_SIZES = (48, 96)
+
+WEBP = ".webp"
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 82, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 80, "method": 4},
+}
+
+
+def variant_name(name, label, ext=None):
+    root, original_ext = os.path.splitext(name)
+    return f"{root}_{label}{ext or original_ext}"
+
+
+def _open(field_file):
+    field_file.open("rb")
+    try:
+        image = Image.open(field_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    finally:
+        field_file.close()
+    return image
+
+
+def _encode(image, ext):
+    format = Image.registered_extensions().get(ext.lower(), "JPEG")
+    if format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    buffer = BytesIO()
+    image.save(buffer, format, **SAVE_OPTIONS.get(format, {}))
+    return ContentFile(buffer.getvalue())
+
+
+def _store(storage, name, image):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, _encode(image, os.path.splitext(name)[1]))
+
+
+def _save_variant(field_file, label, image):
+    storage, name = field_file.storage, field_file.name
+    _store(storage, variant_name(name, label), image)
+    _store(storage, variant_name(name, label, WEBP), image)
+
+
+def render_post_variants(field_file):
+    image = _open(field_file)
+    width, height = image.size
+    variants = []
+    # Work from the largest size down so that each resize starts from an
+    # already reduced image.
+    targets = []
+    for target in POST_WIDTHS:
+        targets.append((target, min(target, width)))
+        if target >= width:
+            break
+    current = image
+    for label, target in reversed(targets):
+        if target != current.width:
+            size = (target, max(1, round(height * target / width)))
+            current = current.resize(size, Image.Resampling.LANCZOS)
+        _save_variant(field_file, f"{label}w", current)
+        variants.append([label, target])
+    variants.reverse()
+    return {"width": width, "height": height, "variants": variants}
+
+
+def render_icon_variants(field_file):
+    image = _open(field_file)
+    sizes = []
+    for size in sorted(ICON_SIZES, reverse=True):
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        _save_variant(field_file, f"s{size}", image)
+        sizes.append(size)
+    sizes.reverse()
+    return {"sizes": sizes}
+
+
+def variant_names(name):
+    """Every name a variant of ``name`` may have been stored under."""
+    labels = [f"{width}w" for width in POST_WIDTHS]
+    labels += [f"s{size}" for size in ICON_SIZES]
+    return [variant_name(name, label, ext) for label in labels for ext in (None, WEBP)]
+
+
+def delete_variants(storage, name):
+    delete = getattr(storage, "delete_derivative", storage.delete)
+    for variant in variant_names(name):
+        delete(variant)
+
+
+def generate_post_variants(post):
+    post.img_variants = render_post_variants(post.img) if post.img else {}
+    post.save(update_fields=["img_variants", "updated_at"])
+
+
+def generate_icon_variants(user):
+    user.icon_variants = render_icon_variants(user.icon) if user.icon else {}
+    user.save(update_fields=["icon_variants"])
+
+
+def srcset(field_file, variants, webp=False):
+    ext = WEBP if webp else None
+    return ", ".join(
+        f"{field_file.storage.url(variant_name(field_file.name, f'{label}w', ext))} "
+        f"{width}w"
+        for label, width in variants.get("variants", ())
+    )
@@ -0,0 +1,182 @@
+"""
+A small database-backed job queue.
+
+Jobs are rows in ``main_job``; ``run_worker`` claims them with conditional
+UPDATEs and runs them on a thread pool, so no broker is needed. A claimed
+job is leased until ``locked_until``. If the worker dies, the lease expires
+and another worker picks the job up again. Failures are retried with
+exponential backoff until ``max_attempts`` is reached.
+"""
+
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+VISIBILITY_TIMEOUT = 300
+RETRY_DELAY = 10
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, func, name, on_failure=None):
+        self.func = func
+        self.name = name
+        self.on_failure = on_failure
+
+    def __call__(self, **payload):
+        return self.func(**payload)
+
+    def delay(self, **payload):
+        return enqueue(self.name, **payload)
+
+
+def task(name=None, on_failure=None):
+    """Register a function as a job; ``on_failure`` runs after the last retry."""
+
+    def decorator(func):
+        registered = Task(
+            func, name or f"{func.__module__}.{func.__name__}", on_failure
+        )
+        _registry[registered.name] = registered
+        return registered
+
+    return decorator
+
+
+def enqueue(task_name, *, delay=0, max_attempts=3, **payload):
+    job = Job.objects.create(
+        task=task_name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if getattr(settings, "JOBS_EAGER", False):
+        transaction.on_commit(lambda: run_now(job.pk))
+    return job
+
+
+def _claimable(now):
+    return Q(status=Job.QUEUED, run_after__lte=now) | Q(
+        status=Job.RUNNING, locked_until__lt=now
+    )
+
+
+@retry_on_locked
+def _claim(pk, now, timeout):
+    return Job.objects.filter(_claimable(now), pk=pk).update(
+        status=Job.RUNNING,
+        locked_until=now + timedelta(seconds=timeout),
+        attempts=F("attempts") + 1,
+        updated_at=now,
+    )
+
+
+def claim(limit, timeout=VISIBILITY_TIMEOUT):
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(_claimable(now))
+        .order_by("run_after", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    claimed = [pk for pk in list(candidates) if _claim(pk, now, timeout)]
+    return list(Job.objects.filter(pk__in=claimed).order_by("run_after", "id"))
+
+
+def run_now(pk, timeout=VISIBILITY_TIMEOUT):
+    if _claim(pk, timezone.now(), timeout):
+        return run(Job.objects.get(pk=pk))
+    return False
+
+
+@retry_on_locked
+def _finish(job, **fields):
+    # Only the holder of the current lease may settle the job.
+    return Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, attempts=job.attempts
+    ).update(updated_at=timezone.now(), **fields)
+
+
+def run(job):
+    registered = _registry.get(job.task)
+    try:
+        if registered is None:
+            raise LookupError(f"Unknown task {job.task!r}")
+        registered(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Job %s failed (attempt %d)", job, job.attempts)
+        if job.attempts >= job.max_attempts or registered is None:
+            if _finish(job, status=Job.FAILED, last_error=error) and registered:
+                if registered.on_failure:
+                    registered.on_failure(**job.payload)
+        else:
+            delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+            _finish(
+                job,
+                status=Job.QUEUED,
+                locked_until=None,
+                run_after=timezone.now() + timedelta(seconds=delay),
+                last_error=error,
+            )
+        return False
+    _finish(job, status=Job.DONE, locked_until=None, last_error="")
+    return True
+
+
+def purge(older_than):
+    cutoff = timezone.now() - older_than
+    deleted, _ = Job.objects.filter(status=Job.DONE, updated_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    def __init__(self, concurrency=4, timeout=VISIBILITY_TIMEOUT, poll_interval=1.0):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def _run(self, job):
+        try:
+            run(job)
+        finally:
+            close_old_connections()
+            self._slots.release()
+
+    def _free_slots(self):
+        free = 0
+        while free < self.concurrency and self._slots.acquire(blocking=False):
+            free += 1
+        return free
+
+    def run(self, once=False):
+        """Process jobs until ``stop()`` is called, or until idle if ``once``."""
+        with ThreadPoolExecutor(self.concurrency, "job-worker") as pool:
+            while not self.stopping.is_set():
+                free = self._free_slots()
+                jobs = claim(free, self.timeout) if free else []
+                for _ in range(free - len(jobs)):
+                    self._slots.release()
+                for job in jobs:
+                    pool.submit(self._run, job)
+                if not jobs:
+                    if once and free == self.concurrency:
+                        break
+                    self.stopping.wait(self.poll_interval)
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,154 @@
+"""
+Idempotent like/unlike operations.
+
+Each change is a single conditional statement on the ``User.like`` through
+table; ``Post.like_count`` is only touched when a row was actually inserted
+or deleted, so repeating a request never skews the counter. Changes are
+also logged as ``LikeEvent`` rows and move ``Post.trending_score``, see
+``main.trending``.
+"""
+
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import trending
+from .db import retry_on_locked
+from .models import Post, User
+
+Like = User.like.through
+
+
+def _insert(using, user_id, post_id):
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    post_pk = Post._meta.pk.column
+    sql = (
+        f"INSERT INTO {qn(Like._meta.db_table)} "
+        f"({qn(Like._meta.get_field('user').column)}, "
+        f"{qn(Like._meta.get_field('post').column)}) "
+        f"SELECT %s, {qn(post_pk)} FROM {qn(Post._meta.db_table)} "
+        f"WHERE {qn(post_pk)} = %s ON CONFLICT DO NOTHING"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, post_id])
+        return cursor.rowcount
+
+
+def _delete(using, user_id, post_id):
+    deleted, _ = (
+        Like.objects.using(using).filter(user_id=user_id, post_id=post_id).delete()
+    )
+    return deleted
+
+
+def _apply(using, user_id, added=(), removed=()):
+    """
+    Update the counters and trending scores of the posts whose like state
+    changed, in one statement, and log the changes.
+    """
+    now = timezone.now()
+    epoch = trending.get_epoch(using, now)
+    counts = {**dict.fromkeys(added, 1), **dict.fromkeys(removed, -1)}
+    scores = dict.fromkeys(counts, 0.0)
+    scores.update(dict.fromkeys(added, trending.weight(now, epoch)))
+    if removed:
+        taken = trending.unlike_weights(using, user_id, removed, epoch)
+        scores.update({post_id: -score for post_id, score in taken.items()})
+    Post.objects.using(using).filter(id__in=counts).update(
+        like_count=F("like_count") + trending.per_post(counts),
+        trending_score=F("trending_score") + trending.per_post(scores),
+        updated_at=now,
+    )
+    trending.log_events(using, user_id, added, removed, now)
+
+
+@retry_on_locked
+def set_like(user, post_id, liked):
+    """
+    Make ``user``'s like state for ``post_id`` equal to ``liked``.
+
+    Return True when the state changed. Raise ``Post.DoesNotExist`` when
+    nothing changed because the post is gone.
+    """
+    using = router.db_for_write(Like)
+    with transaction.atomic(using=using, savepoint=False):
+        if liked:
+            changed = _insert(using, user.pk, post_id)
+        else:
+            changed = _delete(using, user.pk, post_id)
+        if changed:
+            _apply(using, user.pk, **{"added" if liked else "removed": [post_id]})
+    if not changed and not Post.objects.using(using).filter(id=post_id).exists():
+        raise Post.DoesNotExist
+    return bool(changed)
+
+
+@retry_on_locked
+def toggle_like(user, post_id):
+    """Flip ``user``'s like state for ``post_id`` and return the new state."""
+    using = router.db_for_write(Like)
+    with transaction.atomic(using=using, savepoint=False):
+        if _delete(using, user.pk, post_id):
+            liked = False
+        elif _insert(using, user.pk, post_id):
+            liked = True
+        else:
+            liked = None
+        if liked is not None:
+            _apply(using, user.pk, **{"added" if liked else "removed": [post_id]})
+    # Raised outside the block: an exception inside a savepoint-less atomic
+    # block would break the caller's transaction.
+    if liked is None:
+        raise Post.DoesNotExist
+    return liked
+
+
+@retry_on_locked
+def set_likes(user, states):
+    """
+    Apply ``{post_id: liked}`` for ``user`` in one transaction.
+
+    Return ``(results, missing)``: a ``{"id", "liked", "changed"}`` dict per
+    applied change and the ids of posts that no longer exist. The current
+    likes are read inside the write transaction, so the whole batch takes a
+    fixed number of statements however many posts it touches.
+    """
+    using = router.db_for_write(Like)
+    with transaction.atomic(using=using):
+        existing = set(
+            Post.objects.using(using).filter(id__in=states).values_list("id", flat=True)
+        )
+        current = set(
+            Like.objects.using(using)
+            .filter(user_id=user.pk, post_id__in=existing)
+            .values_list("post_id", flat=True)
+        )
+        added = [
+            post_id
+            for post_id, liked in states.items()
+            if liked and post_id in existing and post_id not in current
+        ]
+        removed = [
+            post_id
+            for post_id, liked in states.items()
+            if not liked and post_id in current
+        ]
+        if added:
+            Like.objects.using(using).bulk_create(
+                [Like(user_id=user.pk, post_id=post_id) for post_id in added]
+            )
+        if removed:
+            Like.objects.using(using).filter(
+                user_id=user.pk, post_id__in=removed
+            ).delete()
+        if added or removed:
+            _apply(using, user.pk, added, removed)
+    changed = set(added) | set(removed)
+    results = [
+        {"id": post_id, "liked": liked, "changed": post_id in changed}
+        for post_id, liked in states.items()
+        if post_id in existing
+    ]
+    missing = [post_id for post_id in states if post_id not in existing]
+    return results, missing
@@ -0,0 +1,206 @@
+import json
+import re
+import statistics
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+
+from main import querycheck
+from main.models import Post, User
+
+Follow = User.follow.through
+
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)\S+$")
+TEMP_BTREE = re.compile(r"USE TEMP B-TREE")
+
+
+def _views(user, post, own_post, keyword):
+    views = [
+        ("home", reverse("home")),
+        ("home?follow", reverse("home") + "?follow"),
+        ("home?trending", reverse("home") + "?trending"),
+        ("home.json", reverse("home_api")),
+        ("post_detail", reverse("post_detail", args=[post.id])),
+        ("settings", reverse("settings")),
+        ("edit_profile", reverse("edit_profile", args=[user.id])),
+        ("search users", reverse("search") + f"?keyword={user.username[:4]}"),
+        ("search posts", reverse("search") + f"?post&keyword={keyword}"),
+        (
+            "search posts by rank",
+            reverse("search") + f"?post&keyword={keyword}&order=rank",
+        ),
+        ("user_typeahead", reverse("user_typeahead") + f"?q={user.username[:4]}"),
+    ]
+    if own_post is not None:
+        views.append(("delete_post", reverse("delete_post", args=[own_post.id])))
+    return views
+
+
+def _querysets(user):
+    # Background reads that no view issues, see main.timeline.
+    followees = Follow.objects.filter(from_user_id=user.pk).values("to_user_id")
+    return [
+        (
+            "timeline.backfill",
+            Post.objects.filter(user_id__in=followees).values_list("id", "post_date"),
+        ),
+        (
+            "timeline.rebuild",
+            Post.objects.filter(
+                Q(user_id=user.pk) | Q(user_id__in=followees)
+            ).values_list("id", "post_date"),
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the GET views and the timeline reads against the current data, "
+        "EXPLAIN QUERY PLAN every SELECT they issue and report full table "
+        "scans and temporary B-tree sorts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--username", help="View as this user (default: most followees)."
+        )
+        parser.add_argument("--keyword", default="cat", help="Post search keyword.")
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Timed runs of each query."
+        )
+        parser.add_argument("--json", action="store_true")
+        parser.add_argument(
+            "--fail-on-issues",
+            action="store_true",
+            help="Exit with an error when any plan has an issue.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("EXPLAIN QUERY PLAN is SQLite specific.")
+        users = User.objects.all()
+        if options["username"]:
+            users = users.filter(username=options["username"])
+        user = users.annotate(followees=Count("follow")).order_by("-followees").first()
+        posts = Post.objects.order_by("-post_date", "-id")
+        post = posts.first()
+        if user is None or post is None:
+            raise CommandError("Audit needs at least one user and one post.")
+
+        # Without caches every page runs the queries that fill them.
+        dummy = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+        with override_settings(CACHES={alias: dummy for alias in settings.CACHES}):
+            reports = []
+            own_post = posts.filter(user=user).first()
+            for label, url in _views(user, post, own_post, options["keyword"]):
+                response, queries = self.run_view(user, url)
+                reports.append(self.audit(label, url, queries, options["repeat"]))
+                page = (getattr(response, "context_data", None) or {}).get("page_obj")
+                next_cursor = getattr(page, "next_cursor", None)
+                if next_cursor:
+                    url += ("&" if "?" in url else "?") + f"cursor={next_cursor}"
+                    response, queries = self.run_view(user, url)
+                    reports.append(
+                        self.audit(f"{label} page 2", url, queries, options["repeat"])
+                    )
+            for label, queryset in _querysets(user):
+                sql, params = queryset.query.sql_with_params()
+                queries = [{"sql": sql, "params": params}]
+                reports.append(self.audit(label, None, queries, options["repeat"]))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(reports, indent=2))
+        else:
+            self.write_reports(reports)
+        issues = sum(len(q["issues"]) for r in reports for q in r["queries"])
+        if issues and options["fail_on_issues"]:
+            raise CommandError(f"{issues} query plan issues.")
+
+    def run_view(self, user, url):
+        request = RequestFactory().get(url)
+        request.user = user
+        match = resolve(request.path_info)
+        view = match.func
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        with CaptureQueriesContext(connection) as context:
+            response = view(request, *match.args, **match.kwargs)
+            if hasattr(response, "render"):
+                response.render()
+        if response.status_code >= 400:
+            raise CommandError(f"GET {url} returned {response.status_code}.")
+        return response, context.captured_queries
+
+    def audit(self, label, url, queries, repeat):
+        report = {"view": label, "url": url, "queries": []}
+        seen = set()
+        for query in queries:
+            sql, params = query["sql"], query.get("params")
+            shape = querycheck.normalize(sql)
+            if (
+                not sql.lstrip().upper().startswith(("SELECT", "WITH"))
+                or "sqlite_master" in sql
+                or shape in seen
+            ):
+                continue
+            seen.add(shape)
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                rows = cursor.fetchall()
+            plan = self.format_plan(rows)
+            issues = [
+                detail
+                for _, _, _, detail in rows
+                if FULL_SCAN.match(detail) or TEMP_BTREE.search(detail)
+            ]
+            report["queries"].append(
+                {
+                    "sql": sql,
+                    "ms": self.time_query(sql, params, repeat),
+                    "plan": plan,
+                    "issues": issues,
+                }
+            )
+        return report
+
+    def format_plan(self, rows):
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node_id] + detail)
+        return lines
+
+    def time_query(self, sql, params, repeat):
+        timings = []
+        with connection.cursor() as cursor:
+            for _ in range(max(repeat, 1)):
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def write_reports(self, reports):
+        for report in reports:
+            heading = report["view"]
+            if report["url"]:
+                heading += f" ({report['url']})"
+            self.stdout.write(self.style.MIGRATE_HEADING(heading))
+            for query in report["queries"]:
+                self.stdout.write(f"  {query['ms']:.2f}ms {query['sql'][:160]}")
+                for line in query["plan"]:
+                    style = (
+                        self.style.WARNING if line.strip() in query["issues"] else str
+                    )
+                    self.stdout.write(style(f"    {line}"))
+        issues = sum(len(q["issues"]) for r in reports for q in r["queries"])
+        style = self.style.WARNING if issues else self.style.SUCCESS
+        self.stdout.write(style(f"{issues} full scans or temporary sorts."))
@@ -0,0 +1,107 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections
+from django.test import override_settings
+
+from main import db, likes
+from main.models import Post, User
+
+PROFILES = {
+    # Django's previous setup: rollback journal, full sync, a connection per
+    # request and deferred transactions.
+    "default": {
+        "pragmas": {},
+        "settings": {"CONN_MAX_AGE": 0, "OPTIONS": {}},
+    },
+    # The shipped DATABASES settings and main.db pragmas.
+    "tuned": {"pragmas": None, "settings": {}},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure like write throughput of likes.set_like() from parallel "
+        "threads on a scratch SQLite database, with the default and the tuned "
+        "connection setup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--likes", type=int, default=2000)
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument(
+            "--profile", choices=sorted(PROFILES), action="append", dest="profiles"
+        )
+
+    def handle(self, *args, **options):
+        for name in options["profiles"] or sorted(PROFILES):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "bench.sqlite3")
+                with self.scratch_database(path, PROFILES[name]):
+                    self.seed(options)
+                    result = self.run_profile(options)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name}: {result['likes']} likes in {result['seconds']:.2f}s "
+                    f"({result['likes'] / result['seconds']:.0f}/s), "
+                    f"{result['errors']} failed"
+                )
+            )
+
+    @contextmanager
+    def scratch_database(self, path, profile):
+        pragmas = {}
+        if profile["pragmas"] is not None:
+            pragmas["SQLITE_PRAGMAS"] = profile["pragmas"]
+        with override_settings(**pragmas):
+            with db.scratch_database(path, **profile["settings"]):
+                yield
+
+    def seed(self, options):
+        users = User.objects.bulk_create(
+            User(username=f"bench{i}", email=f"bench{i}@example.com")
+            for i in range(options["threads"] + 1)
+        )
+        Post.objects.bulk_create(
+            Post(user=users[0], img=f"posts/bench{i}.jpg")
+            for i in range(options["posts"])
+        )
+
+    def run_profile(self, options):
+        post_ids = list(Post.objects.values_list("pk", flat=True))
+        users = list(User.objects.order_by("pk")[1:])
+        connections.close_all()
+        per_thread = options["likes"] // options["threads"]
+        lock = threading.Lock()
+        totals = {"likes": 0, "errors": 0}
+
+        def worker(user):
+            counts = {"likes": 0, "errors": 0}
+            for post_id in random.choices(post_ids, k=per_thread):
+                try:
+                    likes.set_like(user, post_id, True)
+                    counts["likes"] += 1
+                except OperationalError:
+                    counts["errors"] += 1
+                # What request_finished does: drop connections that are past
+                # CONN_MAX_AGE, every time without persistent connections.
+                close_old_connections()
+            connections.close_all()
+            with lock:
+                for key, value in counts.items():
+                    totals[key] += value
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        totals["seconds"] = time.perf_counter() - started
+        return totals
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import SUPPRESS
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import StringIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncClient, Client
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from main import db, seeding
+from main.models import Post, User
+
+DEFAULT_URLS = ["/home/", "/home/?follow", "/search/?post&keyword=the"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests per second of the sync views behind the WSGI handler "
+        "(thread pool) with the async views behind the ASGI handler "
+        "(concurrent tasks on one event loop), on a freshly seeded scratch "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--username", help="User to log in as (default: first).")
+        parser.add_argument(
+            "--url", action="append", dest="urls", help="GET url (repeatable)."
+        )
+        parser.add_argument(
+            "--no-like",
+            action="store_false",
+            dest="like",
+            help="Do not mix like API calls into the traffic.",
+        )
+        parser.add_argument(
+            "--users", type=int, default=200, help="Users to seed (default: 200)."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        # Internal: run one mode against an already seeded database.
+        parser.add_argument("--mode", choices=["wsgi", "asgi"], help=SUPPRESS)
+        parser.add_argument("--database", help=SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            if not options["database"]:
+                raise CommandError("--mode needs --database.")
+            with self.scratch_environment(options["database"]):
+                result = self.run_mode(options)
+            self.stdout.write(json.dumps(result))
+            return
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "bench.sqlite3")
+            with self.scratch_environment(database, migrate=True):
+                counts = seeding.seed(
+                    options["users"], seed=options["seed"], stdout=StringIO()
+                )
+            self.stdout.write(
+                "Seeded {users} users, {posts} posts, {follows} follows and "
+                "{likes} likes.".format(**counts)
+            )
+            errors = 0
+            for mode, async_views in (("wsgi", "0"), ("asgi", "1")):
+                result = self.run_subprocess(mode, async_views, database, options)
+                errors += result["errors"]
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{mode}: {result['requests']} requests in "
+                        f"{result['seconds']:.2f}s ({result['rps']:.0f} req/s), "
+                        f"{result['errors']} errors"
+                    )
+                )
+        if errors:
+            raise CommandError(f"{errors} requests failed; the timings are void.")
+
+    @contextmanager
+    def scratch_environment(self, database, migrate=False):
+        """
+        Run against the scratch ``database`` with a private cache and media
+        directory, accepting the test client's host.
+        """
+        setup_test_environment()
+        try:
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+                    }
+                },
+                MEDIA_ROOT=os.path.join(os.path.dirname(database), "media"),
+                PERF_STATS_DIR="",
+                QUERY_CHECK="off",
+            ):
+                with db.scratch_database(database, migrate=migrate):
+                    yield
+        finally:
+            teardown_test_environment()
+
+    def run_subprocess(self, mode, async_views, database, options):
+        # ASYNC_VIEWS is read when the URLconf is imported, so each mode runs
+        # in its own process.
+        command = [sys.executable, sys.argv[0], "bench_views", "--mode", mode]
+        command += ["--database", database]
+        for name in ("requests", "concurrency"):
+            command += [f"--{name}", str(options[name])]
+        if options["username"]:
+            command += ["--username", options["username"]]
+        for url in options["urls"] or []:
+            command += ["--url", url]
+        if not options["like"]:
+            command.append("--no-like")
+        output = subprocess.run(
+            command,
+            env={**os.environ, "ASYNC_VIEWS": async_views},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def build_requests(self, options):
+        urls = options["urls"] or DEFAULT_URLS
+        post = Post.objects.order_by("-id").first() if options["like"] else None
+        requests = []
+        for i in range(options["requests"]):
+            if post and i % (len(urls) + 1) == len(urls):
+                # Setting the same state keeps the like counts unchanged.
+                requests.append(("post", f"/like/{post.id}", {"state": "1"}))
+            else:
+                requests.append(("get", urls[i % len(urls)], None))
+        return requests
+
+    def get_user(self, options):
+        users = User.objects.order_by("id")
+        if options["username"]:
+            users = users.filter(username=options["username"])
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to log in as.")
+        return user
+
+    def run_mode(self, options):
+        user = self.get_user(options)
+        requests = self.build_requests(options)
+        if options["mode"] == "asgi":
+            if not settings.ASYNC_VIEWS:
+                raise CommandError("Run the asgi mode with ASYNC_VIEWS=1.")
+            errors, seconds = asyncio.run(
+                self.run_asgi(user, requests, options["concurrency"])
+            )
+        else:
+            errors, seconds = self.run_wsgi(user, requests, options["concurrency"])
+        return {
+            "requests": len(requests),
+            "seconds": seconds,
+            "rps": len(requests) / seconds,
+            "errors": errors,
+        }
+
+    def run_wsgi(self, user, requests, concurrency):
+        chunks = [requests[i::concurrency] for i in range(concurrency)]
+
+        def worker(chunk):
+            client = Client()
+            client.force_login(user)
+            errors = 0
+            for method, url, data in chunk:
+                response = getattr(client, method)(url, data)
+                errors += response.status_code >= 400
+            close_old_connections()
+            return errors
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            started = time.perf_counter()
+            errors = sum(pool.map(worker, chunks))
+        return errors, time.perf_counter() - started
+
+    async def run_asgi(self, user, requests, concurrency):
+        chunks = [requests[i::concurrency] for i in range(concurrency)]
+
+        async def worker(chunk):
+            client = AsyncClient()
+            await client.aforce_login(user)
+            errors = 0
+            for method, url, data in chunk:
+                response = await getattr(client, method)(url, data)
+                errors += response.status_code >= 400
+            return errors
+
+        started = time.perf_counter()
+        errors = sum(await asyncio.gather(*(worker(chunk) for chunk in chunks)))
+        return errors, time.perf_counter() - started
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from main import tasks, trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Rescale the trending scores of all posts to an epoch of now and "
+        "prune old like events."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--schedule",
+            action="store_true",
+            help="Also queue the periodic compact_trending job.",
+        )
+
+    def handle(self, *args, **options):
+        rescaled, cleared, pruned = trending.compact()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rescaled {rescaled} scores, cleared {cleared}, "
+                f"pruned {pruned} like events."
+            )
+        )
+        if options["schedule"] and tasks.schedule_trending_compaction():
+            self.stdout.write("Queued the compact_trending job.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from main import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream users, posts, follows, likes and like events to JSON lines "
+        "files in a directory, optionally with the media files they refer to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument(
+            "--media", action="store_true", help="Also write media.tar."
+        )
+        parser.add_argument("--chunk-size", type=int, default=transfer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        transfer.export_to(
+            options["directory"],
+            media=options["media"],
+            chunk_size=options["chunk_size"],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Exported to {options['directory']}."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from main import images
+from main.models import Post, User
+
+
+class Command(BaseCommand):
+    help = "Generate resized and WebP variants for existing posts and icons."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true", help="Regenerate existing variants."
+        )
+        parser.add_argument("--posts-only", action="store_true")
+        parser.add_argument("--icons-only", action="store_true")
+
+    def handle(self, *args, **options):
+        if not options["icons_only"]:
+            posts = Post.objects.exclude(img="")
+            if not options["force"]:
+                posts = posts.filter(img_variants={})
+            self._generate(posts, images.generate_post_variants, "post images")
+        if not options["posts_only"]:
+            users = User.objects.exclude(icon="")
+            if not options["force"]:
+                users = users.filter(icon_variants={})
+            self._generate(users, images.generate_icon_variants, "icons")
+
+    def _generate(self, queryset, generate, label):
+        done = failed = 0
+        for obj in queryset.order_by("pk").iterator(chunk_size=100):
+            try:
+                generate(obj)
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"{obj.__class__.__name__} {obj.pk}: {e}")
+            else:
+                done += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated variants for {done} {label}.")
+            + (f" {failed} failed." if failed else "")
+        )
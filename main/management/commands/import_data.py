@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a directory written by export_data into an empty database. An "
+        "interrupted import resumes where it stopped when run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=transfer.BATCH_SIZE,
+            help="Rows per bulk insert and per unit of work.",
+        )
+        parser.add_argument(
+            "--workers", type=int, help="Worker processes (default: CPU count)."
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint of an earlier run.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            transfer.import_from(
+                options["directory"],
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+                restart=options["restart"],
+                stdout=self.stdout,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(f"Imported from {options['directory']}."))
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from main import perf
+
+
+class Command(BaseCommand):
+    help = "Print request timing percentiles per URL name from all processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Output JSON.")
+        parser.add_argument(
+            "--clear", action="store_true", help="Discard the recorded samples."
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            perf.clear()
+            self.stdout.write(self.style.SUCCESS("Cleared request timings."))
+            return
+        rows = perf.summary()
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+        if not rows:
+            self.stdout.write("No requests recorded yet.")
+            return
+        percentiles = [f"p{p}" for p in perf.PERCENTILES]
+        width = max(len("url name"), *(len(row["name"]) for row in rows))
+        columns = [f"{metric}.{p}" for metric in perf.METRICS for p in percentiles]
+        self.stdout.write(
+            f"{'url name':<{width}} {'count':>6} "
+            + " ".join(f"{column:>13}" for column in columns)
+        )
+        for row in rows:
+            values = [row[metric][p] for metric in perf.METRICS for p in percentiles]
+            self.stdout.write(
+                f"{row['name']:<{width}} {row['count']:>6} "
+                + " ".join(f"{value:>13.1f}" for value in values)
+            )
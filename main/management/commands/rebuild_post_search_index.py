@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from main import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 index used by post search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if not search.fts_available(options["database"]):
+            raise CommandError(
+                "The post search index does not exist on this database; "
+                "search uses icontains instead."
+            )
+        count = search.rebuild_index(options["database"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} posts."))
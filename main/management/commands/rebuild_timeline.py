@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from main import timeline
+from main.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized follow timeline from posts and follows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "user_ids", nargs="*", type=int, help="Only rebuild these users."
+        )
+        parser.add_argument("--batch-size", type=int, default=timeline.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["user_ids"]:
+            users = users.filter(id__in=options["user_ids"])
+        # Not an iterator: its open read would keep SQLite from resetting the
+        # WAL while the rebuilds write, so the file would grow without bound.
+        user_ids = list(users.values_list("id", flat=True))
+        for user_id in user_ids:
+            timeline.rebuild(user_id, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(user_ids)} timelines."))
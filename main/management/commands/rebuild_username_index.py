@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import usersearch
+
+
+class Command(BaseCommand):
+    help = "Rebuild the n-gram index used by username search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=usersearch.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = usersearch.rebuild_index(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} username grams."))
@@ -0,0 +1,36 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from main.models import Post, User
+
+
+class Command(BaseCommand):
+    help = "Recount Post.like_count from the like through table and fix drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counts = (
+            User.like.through.objects.filter(post_id=OuterRef("pk"))
+            .values("post_id")
+            .annotate(count=Count("*"))
+            .values("count")
+        )
+        actual = Coalesce(Subquery(counts), 0)
+        post_ids = Post.objects.order_by("id").values_list("id", flat=True).iterator()
+        checked = fixed = 0
+        while batch := list(islice(post_ids, options["batch_size"])):
+            fixed += (
+                Post.objects.filter(id__in=batch)
+                .alias(actual=actual)
+                .exclude(like_count=actual)
+                .update(like_count=actual)
+            )
+            checked += len(batch)
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {checked} posts, fixed {fixed} counts.")
+        )
@@ -0,0 +1,56 @@
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from main import images
+from main.models import MediaBlob, Post, User
+from main.storage import is_addressed
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount MediaBlob references from Post.img and User.icon and "
+        "optionally delete files nothing refers to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete-orphans",
+            action="store_true",
+            help="Delete blobs (and their variants) without references.",
+        )
+
+    def handle(self, *args, **options):
+        refs = Counter()
+        for model, field in ((Post, "img"), (User, "icon")):
+            rows = (
+                model.objects.exclude(**{field: ""})
+                .values_list(field)
+                .annotate(count=Count("pk"))
+                .order_by()
+            )
+            for name, count in rows.iterator():
+                if is_addressed(name):
+                    refs[name] += count
+
+        fixed = orphans = 0
+        for blob in MediaBlob.objects.iterator():
+            actual = refs.pop(blob.name, 0)
+            if actual == 0 and options["delete_orphans"]:
+                blob.delete()
+                default_storage.delete(blob.name)
+                images.delete_variants(default_storage, blob.name)
+                orphans += 1
+            elif blob.refs != actual:
+                MediaBlob.objects.filter(pk=blob.pk).update(refs=actual)
+                fixed += 1
+        for name, count in refs.items():
+            MediaBlob.objects.update_or_create(name=name, defaults={"refs": count})
+            fixed += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Fixed {fixed} reference counts, deleted {orphans} orphans."
+            )
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main import suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the follow suggestions of every user from the follow "
+        "graph on a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, help="Worker processes (default: CPU count)."
+        )
+        parser.add_argument(
+            "--shard-size",
+            type=int,
+            default=suggestions.SHARD_SIZE,
+            help="Users computed per worker task.",
+        )
+
+    def handle(self, *args, **options):
+        users, stored = suggestions.refresh_all(
+            workers=options["workers"], shard_size=options["shard_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Stored {stored} suggestions for {users} users.")
+        )
@@ -0,0 +1,222 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from main import perf, seeding
+from main.models import Post, User
+
+SCENARIOS = (
+    "home",
+    "home_follow",
+    "search_users",
+    "search_posts",
+    "post_detail",
+    "like",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed scratch databases of several sizes (see seed_data) and measure "
+        "latency and query counts of the main pages. Results are appended as "
+        "JSON lines to --output so that runs can be compared over time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,10000",
+            help="Comma separated numbers of users to seed (default: 1000,10000).",
+        )
+        parser.add_argument("--posts-per-user", type=float, default=10)
+        parser.add_argument("--follows-per-user", type=float, default=50)
+        parser.add_argument("--likes-per-user", type=float, default=100)
+        parser.add_argument("--images", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--requests", type=int, default=100, help="Measured requests per scenario."
+        )
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument(
+            "--scenario",
+            choices=SCENARIOS,
+            action="append",
+            dest="scenarios",
+            help="Only run this scenario (repeatable).",
+        )
+        parser.add_argument("--output", default="benchmarks.jsonl")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of numbers.")
+        run = {
+            "timestamp": timezone.now().isoformat(),
+            "commit": self.git_commit(),
+            "async_views": settings.ASYNC_VIEWS,
+        }
+        setup_test_environment()
+        try:
+            for users in sizes:
+                with tempfile.TemporaryDirectory() as directory:
+                    records = self.run_size(users, directory, options)
+                with open(options["output"], "a") as f:
+                    for record in records:
+                        f.write(json.dumps({**run, **record}) + "\n")
+        finally:
+            teardown_test_environment()
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def run_size(self, users, directory, options):
+        # A file database, unlike SQLite's in-memory test default, behaves
+        # like the deployed one.
+        test_settings = connections["default"].settings_dict.setdefault("TEST", {})
+        test_name = test_settings.get("NAME")
+        test_settings["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+        old_config = setup_databases(
+            verbosity=0, interactive=False, serialized_aliases=set()
+        )
+        try:
+            with override_settings(
+                MEDIA_ROOT=os.path.join(directory, "media"),
+                PERF_STATS_DIR="",
+                QUERY_CHECK="off",
+            ):
+                for cache in caches.all():
+                    cache.clear()
+                started = time.perf_counter()
+                counts = seeding.seed(
+                    users,
+                    posts_per_user=options["posts_per_user"],
+                    follows_per_user=options["follows_per_user"],
+                    likes_per_user=options["likes_per_user"],
+                    image_pool=options["images"],
+                    seed=options["seed"],
+                    stdout=StringIO(),
+                )
+                self.stdout.write(
+                    "Seeded {users} users, {posts} posts, {follows} follows and "
+                    "{likes} likes".format(**counts)
+                    + f" in {time.perf_counter() - started:.1f}s."
+                )
+                return [
+                    {"dataset": counts, "scenario": scenario, **result}
+                    for scenario, result in self.run_scenarios(options)
+                ]
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            test_settings["NAME"] = test_name
+
+    def run_scenarios(self, options):
+        rng = random.Random(options["seed"])
+        # The busiest follow feed is the slowest one to build.
+        viewer = (
+            User.objects.annotate(followees=Count("follow"))
+            .order_by("-followees", "id")
+            .first()
+        )
+        if viewer is None:
+            raise CommandError("Nothing was seeded.")
+        post_ids = list(Post.objects.values_list("id", flat=True))
+        usernames = list(User.objects.values_list("username", flat=True)[:1000])
+        requests = {
+            "home": lambda: ("get", reverse("home"), None),
+            "home_follow": lambda: ("get", reverse("home"), {"follow": ""}),
+            "search_users": lambda: (
+                "get",
+                reverse("search"),
+                {"keyword": rng.choice(usernames)[: rng.randint(3, 8)]},
+            ),
+            "search_posts": lambda: (
+                "get",
+                reverse("search"),
+                {"post": "", "keyword": rng.choice(seeding.WORDS)},
+            ),
+            "post_detail": lambda: (
+                "get",
+                reverse("post_detail", args=[rng.choice(post_ids)]),
+                None,
+            ),
+            "like": lambda: (
+                "post",
+                reverse("like", args=[rng.choice(post_ids)]),
+                {"state": rng.choice("01")},
+            ),
+        }
+        client = Client()
+        client.force_login(viewer)
+        for scenario in options["scenarios"] or SCENARIOS:
+            for _ in range(options["warmup"]):
+                self.request(client, requests[scenario]())
+            samples = [
+                self.request(client, requests[scenario]())
+                for _ in range(options["requests"])
+            ]
+            result = self.summarize(samples)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{scenario}: p50 {result['latency']['p50']:.1f}ms, "
+                    f"p95 {result['latency']['p95']:.1f}ms, "
+                    f"p99 {result['latency']['p99']:.1f}ms, "
+                    f"{result['queries']['mean']:.1f} queries"
+                )
+            )
+            yield scenario, result
+
+    def request(self, client, request):
+        method, url, data = request
+        started = time.perf_counter()
+        response = getattr(client, method)(url, data)
+        latency = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{method.upper()} {url} returned {response.status_code}."
+            )
+        timing = getattr(response.wsgi_request, "perf_timing", None)
+        if timing is None:
+            raise CommandError("main.middleware.PerformanceMiddleware is not enabled.")
+        return {"latency": latency, **timing.sample()}
+
+    def summarize(self, samples):
+        result = {"requests": len(samples)}
+        for metric in ("latency", "db", "queries"):
+            values = sorted(sample[metric] for sample in samples)
+            result[metric] = {
+                **{f"p{p}": perf.percentile(values, p) for p in perf.PERCENTILES},
+                "mean": statistics.fmean(values),
+                "max": values[-1],
+            }
+        return result
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from main import jobs, tasks
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database queue on a thread pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument(
+            "--visibility-timeout",
+            type=int,
+            default=jobs.VISIBILITY_TIMEOUT,
+            help="Seconds a claimed job stays invisible to other workers.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when no job is runnable."
+        )
+        parser.add_argument(
+            "--purge-days",
+            type=int,
+            default=7,
+            help="Delete finished jobs older than this many days on start.",
+        )
+
+    def handle(self, *args, **options):
+        purged = jobs.purge(timedelta(days=options["purge_days"]))
+        if purged:
+            self.stdout.write(f"Purged {purged} finished jobs.")
+        tasks.schedule_trending_compaction()
+        worker = jobs.Worker(
+            concurrency=options["concurrency"],
+            timeout=options["visibility_timeout"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(
+            f"Worker started with {options['concurrency']} threads. "
+            "Quit with CONTROL-C."
+        )
+        try:
+            worker.run(once=options["once"])
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stdout.write("Worker stopped.")
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create synthetic users, posts with generated images, a power-law "
+        "follow graph and likes for load testing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--posts-per-user", type=float, default=10, help="Mean posts per user."
+        )
+        parser.add_argument(
+            "--follows-per-user", type=float, default=50, help="Mean follows per user."
+        )
+        parser.add_argument(
+            "--likes-per-user", type=float, default=100, help="Mean likes per user."
+        )
+        parser.add_argument(
+            "--images", type=int, default=20, help="Size of the shared image pool."
+        )
+        parser.add_argument("--seed", type=int, help="Random seed for repeatable data.")
+        parser.add_argument("--batch-size", type=int, default=seeding.BATCH_SIZE)
+        parser.add_argument(
+            "--prefix",
+            default=seeding.USERNAME_PREFIX,
+            help="Username prefix; all users get the password "
+            f"{seeding.PASSWORD!r}.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = seeding.seed(
+            options["users"],
+            posts_per_user=options["posts_per_user"],
+            follows_per_user=options["follows_per_user"],
+            likes_per_user=options["likes_per_user"],
+            image_pool=options["images"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            prefix=options["prefix"],
+            stdout=self.stdout,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Created {users} users, {posts} posts, {follows} follows and "
+                "{likes} likes from {images} images".format(**counts)
+                + f" in {time.perf_counter() - started:.1f}s."
+            )
+        )
@@ -0,0 +1,66 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from main import routers
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the replica files with the "
+        "SQLite online backup API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="aliases",
+            help="Replica alias to sync (default: all of DATABASE_REPLICAS).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep syncing every INTERVAL seconds until interrupted.",
+        )
+        parser.add_argument("--pages", type=int, default=1024)
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or routers.replicas()
+        if not aliases:
+            raise CommandError("No replicas configured in DATABASE_REPLICAS.")
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if alias not in settings.DATABASES:
+                raise CommandError(f"Unknown database {alias!r}.")
+            if settings.DATABASES[alias]["ENGINE"] != "django.db.backends.sqlite3":
+                raise CommandError(f"Database {alias!r} is not SQLite.")
+        while True:
+            self.sync(aliases, options["pages"])
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def sync(self, aliases, pages):
+        started = time.perf_counter()
+        source = sqlite3.connect(settings.DATABASES[DEFAULT_DB_ALIAS]["NAME"])
+        try:
+            for alias in aliases:
+                target = sqlite3.connect(settings.DATABASES[alias]["NAME"])
+                try:
+                    # Copying into the live file rather than replacing it lets
+                    # open replica connections see the new data.
+                    source.backup(target, pages=pages)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Synced {', '.join(aliases)} "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
@@ -0,0 +1,135 @@
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from . import perf, querycheck, routers
+
+PIN_COOKIE = "use_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _reads_from_replicas(request):
+    return request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+
+
+def _pin(request, response):
+    # After a write the client keeps reading from the primary until the
+    # replicas have caught up, so it sees its own post or like.
+    if request.method not in SAFE_METHODS and response.status_code < 500:
+        response.set_cookie(
+            PIN_COOKIE,
+            "1",
+            max_age=getattr(settings, "REPLICA_PIN_SECONDS", 5),
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """Route the reads of safe requests to the replicas, see main.routers."""
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            with routers.use_replicas(_reads_from_replicas(request)):
+                response = await get_response(request)
+            return _pin(request, response)
+
+    else:
+
+        def middleware(request):
+            with routers.use_replicas(_reads_from_replicas(request)):
+                response = get_response(request)
+            return _pin(request, response)
+
+    return middleware
+
+
+class PerformanceMiddleware:
+    """
+    Time each request, add a ``Server-Timing`` header and record the sample
+    per URL name in ``main.perf``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with perf.RequestTiming() as timing:
+            request.perf_timing = timing
+            response = self.get_response(request)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        with perf.RequestTiming() as timing:
+            request.perf_timing = timing
+            response = await self.get_response(request)
+        return self.finish(request, response, timing)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.perf_timing.view_started = perf_counter()
+
+    def process_template_response(self, request, response):
+        # Rendering starts right after the template response middleware.
+        timing = request.perf_timing
+        timing.start_render()
+        response.add_post_render_callback(lambda response: timing.end_render())
+        return response
+
+    def finish(self, request, response, timing):
+        response.headers["Server-Timing"] = timing.server_timing()
+        match = request.resolver_match
+        if match is not None and match.url_name:
+            perf.record(match.url_name, timing)
+        return response
+
+
+class QueryCheckMiddleware:
+    """
+    Report N+1 query patterns and exceeded query budgets of each request,
+    see ``main.querycheck``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if querycheck.mode() == querycheck.OFF:
+            return self.get_response(request)
+        with querycheck.record() as log:
+            response = self.get_response(request)
+        return self.finish(request, response, log)
+
+    async def __acall__(self, request):
+        if querycheck.mode() == querycheck.OFF:
+            return await self.get_response(request)
+        with querycheck.record() as log:
+            response = await self.get_response(request)
+        return self.finish(request, response, log)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, "query_budget", None)
+
+    def finish(self, request, response, log):
+        budget = getattr(request, "query_budget", None)
+        querycheck.check(log, budget, f"{request.method} {request.get_full_path()}")
+        return response
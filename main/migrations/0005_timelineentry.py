@@ -0,0 +1,76 @@
+# Generated by Django 5.2.10 on 2026-10-17 03:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def populate_timeline(apps, schema_editor):
+    User = apps.get_model("main", "User")
+    Post = apps.get_model("main", "Post")
+    TimelineEntry = apps.get_model("main", "TimelineEntry")
+    for user in User.objects.all().iterator():
+        posts = Post.objects.filter(Q(user=user) | Q(user__in=user.follow.all()))
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(owner=user, post_id=post_id, post_date=post_date)
+                for post_id, post_date in posts.values_list("id", "post_date")
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0004_delete_comment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("post_date", models.DateTimeField()),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="main.post",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["owner", "-post_date", "-post"],
+                        name="timeline_owner_date_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("owner", "post"), name="unique_timeline_entry"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_timeline, migrations.RunPython.noop),
+    ]
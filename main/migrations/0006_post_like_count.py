@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-17 03:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_like_count(apps, schema_editor):
+    Post = apps.get_model("main", "Post")
+    Like = apps.get_model("main", "User").like.through
+    counts = (
+        Like.objects.filter(post_id=OuterRef("pk"))
+        .values("post_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    Post.objects.update(like_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0005_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_like_count, migrations.RunPython.noop),
+    ]
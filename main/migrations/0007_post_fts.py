@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-17 03:45
+
+from django.db import OperationalError, migrations
+
+
+def create_post_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE main_post_fts USING fts5(note, tokenize='trigram')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5 or older than 3.34: search falls back
+            # to icontains.
+            return
+        cursor.execute(
+            "INSERT INTO main_post_fts (rowid, note) SELECT id, note FROM main_post"
+        )
+
+
+def drop_post_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS main_post_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_post_like_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_post_fts, drop_post_fts),
+    ]
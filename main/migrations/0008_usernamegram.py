@@ -0,0 +1,59 @@
+# Generated by Django 5.2.10 on 2026-10-17 03:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_username_grams(apps, schema_editor):
+    User = apps.get_model("main", "User")
+    UsernameGram = apps.get_model("main", "UsernameGram")
+    for user_id, username in User.objects.values_list("id", "username").iterator():
+        name = username.lower()
+        UsernameGram.objects.bulk_create(
+            [
+                UsernameGram(user_id=user_id, gram=gram)
+                for gram in {name[i : i + 3] for i in range(len(name))}
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_post_fts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UsernameGram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("gram", models.CharField(max_length=3)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="username_grams",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("gram", "user"), name="unique_username_gram"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_username_grams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-17 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_usernamegram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="img_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="icon_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-17 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_updated_at(apps, schema_editor):
+    Post = apps.get_model("main", "Post")
+    Post.objects.using(schema_editor.connection.alias).update(updated_at=F("post_date"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0011_mediablob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-17 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0012_post_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["-post_date", "-id"], name="post_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["user", "-post_date", "-id"], name="post_user_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.10 on 2026-10-17 04:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0013_post_date_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LikeEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("liked", models.BooleanField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TrendingEpoch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("epoch", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="trending_score",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["-trending_score", "-id"], name="post_trending_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="likeevent",
+            name="post",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="like_events",
+                to="main.post",
+            ),
+        ),
+        migrations.AddField(
+            model_name="likeevent",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="like_events",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="likeevent",
+            index=models.Index(
+                fields=["user", "post", "-created_at"], name="like_event_pair_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="likeevent",
+            index=models.Index(fields=["created_at"], name="like_event_created_idx"),
+        ),
+    ]
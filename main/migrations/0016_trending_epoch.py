@@ -0,0 +1,24 @@
+# Generated by Django 5.2.10 on 2026-10-17 09:12
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def create_epoch(apps, schema_editor):
+    # The first like would otherwise create the row and exceed its view's
+    # query budget.
+    TrendingEpoch = apps.get_model("main", "TrendingEpoch")
+    TrendingEpoch.objects.using(schema_editor.connection.alias).get_or_create(
+        pk=1, defaults={"epoch": timezone.now()}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0015_followsuggestion"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_epoch, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.templatetags.static import static
+from django.utils import timezone
+
+from . import images
 
 
 class User(AbstractUser):
@@ -9,6 +13,7 @@ class User(AbstractUser):
     profile = models.CharField(max_length=150)
     follow = models.ManyToManyField("User", related_name="followed")
     icon = models.ImageField(upload_to="icons/", blank=True)
+    icon_variants = models.JSONField(default=dict, blank=True, editable=False)
     like = models.ManyToManyField("Post", related_name="liked_users")
 
     def __str__(self):
@@ -20,12 +25,231 @@ class User(AbstractUser):
             return self.icon.url
         return static("main/img/default-icon.svg")
 
+    def _icon_variant_url(self, size, ext=None):
+        name = images.variant_name(self.icon.name, f"s{size}", ext)
+        return self.icon.storage.url(name)
+
+    @property
+    def icon_thumb_url(self):
+        if self.icon and self.icon_variants:
+            return self._icon_variant_url(images.ICON_SIZES[0])
+        return self.icon_url
+
+    @property
+    def icon_srcset(self):
+        if not (self.icon and self.icon_variants):
+            return ""
+        small, large = self.icon_variants["sizes"][0], self.icon_variants["sizes"][-1]
+        return f"{self._icon_variant_url(small)} 1x, {self._icon_variant_url(large)} 2x"
+
+
+class PostQuerySet(models.QuerySet):
+    def with_liked(self, user):
+        likes = User.like.through.objects.filter(
+            user_id=user.pk, post_id=OuterRef("pk")
+        )
+        return self.annotate(is_liked=Exists(likes))
+
 
 class Post(models.Model):
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PROCESSING, "処理中"),
+        (READY, "完了"),
+        (FAILED, "失敗"),
+    )
+
     user = models.ForeignKey("User", on_delete=models.CASCADE, related_name="posts")
     img = models.ImageField(upload_to="posts/")
     note = models.CharField(max_length=300, blank=True)
     post_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    like_count = models.PositiveIntegerField(default=0)
+    # Decayed like weight relative to TrendingEpoch, see main.trending.
+    trending_score = models.FloatField(default=0, editable=False)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=READY, editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The latest feed and post search by date, see CursorPaginator.
+            models.Index(fields=("-post_date", "-id"), name="post_date_idx"),
+            # A user's posts newest first, also covering the timeline
+            # backfill and rebuild reads.
+            models.Index(
+                fields=("user", "-post_date", "-id"), name="post_user_date_idx"
+            ),
+            # The trending feed, a top-K read.
+            models.Index(fields=("-trending_score", "-id"), name="post_trending_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} : {self.post_date}"
+
+    @property
+    def img_src_url(self):
+        if self.img_variants:
+            label = self.img_variants["variants"][-1][0]
+            return self.img.storage.url(images.variant_name(self.img.name, f"{label}w"))
+        return self.img.url
+
+    @property
+    def img_srcset(self):
+        return images.srcset(self.img, self.img_variants)
+
+    @property
+    def img_webp_srcset(self):
+        return images.srcset(self.img, self.img_variants, webp=True)
+
+    @property
+    def img_sizes(self):
+        return images.POST_SIZES
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey("User", on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(
+        "Post", on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    post_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("owner", "post"), name="unique_timeline_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("owner", "-post_date", "-post"), name="timeline_owner_date_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} <- {self.post_id}"
+
+
+class LikeEvent(models.Model):
+    """A like or unlike, which the ``User.like`` through table has no time of."""
+
+    user = models.ForeignKey(
+        "User", on_delete=models.CASCADE, related_name="like_events"
+    )
+    post = models.ForeignKey(
+        "Post", on_delete=models.CASCADE, related_name="like_events"
+    )
+    liked = models.BooleanField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # The latest like of a pair, whose weight an unlike takes back.
+            models.Index(
+                fields=("user", "post", "-created_at"), name="like_event_pair_idx"
+            ),
+            models.Index(fields=("created_at",), name="like_event_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {'+' if self.liked else '-'} {self.post_id}"
+
+
+class TrendingEpoch(models.Model):
+    """The single row holding the time ``Post.trending_score`` is relative to."""
+
+    epoch = models.DateTimeField()
+
+    def __str__(self):
+        return str(self.epoch)
+
+
+class FollowSuggestion(models.Model):
+    """A user ``user`` may want to follow, see main.suggestions."""
+
+    user = models.ForeignKey(
+        "User", on_delete=models.CASCADE, related_name="follow_suggestions"
+    )
+    suggested = models.ForeignKey("User", on_delete=models.CASCADE, related_name="+")
+    # How many of user's followees follow suggested.
+    mutuals = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "suggested"), name="unique_follow_suggestion"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("user", "-mutuals", "suggested"),
+                name="follow_suggestion_rank_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.suggested_id} ({self.mutuals})"
+
+
+class UsernameGram(models.Model):
+    user = models.ForeignKey(
+        "User", on_delete=models.CASCADE, related_name="username_grams"
+    )
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("gram", "user"), name="unique_username_gram"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.gram} -> {self.user_id}"
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "queued"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    )
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=("status", "run_after"), name="job_ready_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+    size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs})"
@@ -0,0 +1,118 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import Sequence
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage(Sequence):
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return "<Cursor page of %d items>" % len(self)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over a ``(date, id)`` pair in descending order.
+
+    Unlike ``django.core.paginator.Paginator`` it never counts the queryset
+    and never uses ``OFFSET``: each page is a range read starting right after
+    the row encoded in the cursor.
+    """
+
+    NEXT = "n"
+    PREVIOUS = "p"
+
+    def __init__(self, queryset, per_page, date_field="post_date", id_field="id"):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.date_field = date_field
+        self.id_field = id_field
+
+    def encode_cursor(self, direction, obj):
+        date = getattr(obj, self.date_field)
+        pk = getattr(obj, self.id_field)
+        raw = f"{direction}|{date.isoformat()}|{pk}".encode()
+        return urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            direction, date, pk = raw.split("|")
+            date = parse_datetime(date)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise InvalidCursor(cursor)
+        if date is None or direction not in (self.NEXT, self.PREVIOUS):
+            raise InvalidCursor(cursor)
+        return direction, date, pk
+
+    def _range(self, direction, date, pk):
+        date_field, id_field = self.date_field, self.id_field
+        if direction == self.NEXT:
+            lookup, ordering = "lt", ("-" + date_field, "-" + id_field)
+        else:
+            lookup, ordering = "gt", (date_field, id_field)
+        queryset = self.queryset.order_by(*ordering)
+        if date is None:
+            return queryset
+        return queryset.filter(
+            Q(**{f"{date_field}__{lookup}": date})
+            | Q(**{date_field: date, f"{id_field}__{lookup}": pk})
+        )
+
+    def page(self, cursor=None):
+        if cursor:
+            direction, date, pk = self.decode_cursor(cursor)
+        else:
+            direction, date, pk = self.NEXT, None, None
+        rows = list(self._range(direction, date, pk)[: self.per_page + 1])
+        return self._build_page(rows, direction, bool(cursor))
+
+    async def apage(self, cursor=None):
+        if cursor:
+            direction, date, pk = self.decode_cursor(cursor)
+        else:
+            direction, date, pk = self.NEXT, None, None
+        queryset = self._range(direction, date, pk)[: self.per_page + 1]
+        rows = [row async for row in queryset]
+        return self._build_page(rows, direction, bool(cursor))
+
+    def _build_page(self, rows, direction, has_cursor):
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if direction == self.PREVIOUS:
+            rows.reverse()
+            has_next, has_previous = has_cursor, has_more
+        else:
+            has_next, has_previous = has_more, has_cursor
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(self.NEXT, rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(self.PREVIOUS, rows[0])
+        return CursorPage(rows, self, next_cursor, previous_cursor)
@@ -0,0 +1,209 @@
+"""
+Per-request timing statistics.
+
+``main.middleware.PerformanceMiddleware`` records one sample per request:
+total, view, SQL and template time in milliseconds plus the query count.
+Samples go into a bounded deque per URL name, so recording is an append
+and memory stays fixed. SQL is measured by an execute wrapper installed on
+every connection, which only does work while a request is being timed.
+
+Each process writes its samples to ``PERF_STATS_DIR`` every
+``PERF_STATS_FLUSH_INTERVAL`` seconds, so that the admin page and
+``manage.py perf_stats`` can aggregate over all worker processes. Files
+of processes that have exited, as after a reload or a worker restart, are
+removed on load; files not written for ``PERF_STATS_MAX_AGE`` seconds, as
+those of another host's processes, are skipped.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+METRICS = ("total", "view", "db", "queries", "template")
+PERCENTILES = (50, 95, 99)
+
+_current = ContextVar("request_timing", default=None)
+_samples = {}
+_lock = threading.Lock()
+_last_flush = 0.0
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = perf_counter()
+        self.view_started = None
+        self.render_started = None
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._token)
+        self.total = perf_counter() - self.started
+
+    def start_render(self):
+        self.render_started = perf_counter()
+
+    def end_render(self):
+        if self.render_started is not None:
+            self.template += perf_counter() - self.render_started
+            self.render_started = None
+
+    def sample(self):
+        view = self.total
+        if self.view_started is not None:
+            view = self.total - (self.view_started - self.started)
+        return {
+            "total": self.total * 1000,
+            "view": (view - self.template) * 1000,
+            "db": self.db * 1000,
+            "queries": self.queries,
+            "template": self.template * 1000,
+        }
+
+    def server_timing(self):
+        sample = self.sample()
+        return ", ".join(
+            [
+                f'db;dur={sample["db"]:.1f};desc="{sample["queries"]} queries"',
+                f'tpl;dur={sample["template"]:.1f};desc="template"',
+                f'view;dur={sample["view"]:.1f};desc="view"',
+                f'total;dur={sample["total"]:.1f};desc="total"',
+            ]
+        )
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.queries += 1
+        timing.db += perf_counter() - started
+
+
+@receiver(connection_created)
+def install_execute_wrapper(sender, connection, **kwargs):
+    # connection_created fires again on every reconnect of the same wrapper.
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def _stats_dir():
+    return getattr(
+        settings,
+        "PERF_STATS_DIR",
+        os.path.join(tempfile.gettempdir(), "beengram-perf"),
+    )
+
+
+def record(name, timing):
+    samples = _samples.get(name)
+    if samples is None:
+        with _lock:
+            samples = _samples.setdefault(
+                name, deque(maxlen=getattr(settings, "PERF_STATS_SIZE", 1000))
+            )
+    samples.append(timing.sample())
+    if time.monotonic() - _last_flush > getattr(
+        settings, "PERF_STATS_FLUSH_INTERVAL", 10
+    ):
+        flush()
+
+
+def flush():
+    global _last_flush
+    _last_flush = time.monotonic()
+    directory = _stats_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with _lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def load():
+    """Return ``{url_name: [sample, ...]}`` merged over all live processes."""
+    with _lock:
+        merged = {name: list(samples) for name, samples in _samples.items()}
+    directory = _stats_dir()
+    if not directory or not os.path.isdir(directory):
+        return merged
+    own = f"{os.getpid()}.json"
+    oldest = time.time() - getattr(settings, "PERF_STATS_MAX_AGE", 3600)
+    for filename in os.listdir(directory):
+        if not filename.endswith(".json") or filename == own:
+            continue
+        path = os.path.join(directory, filename)
+        pid = filename.removesuffix(".json")
+        try:
+            if pid.isdigit() and not _process_exists(int(pid)):
+                os.remove(path)
+                continue
+            if os.path.getmtime(path) < oldest:
+                continue
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, samples in data.items():
+            merged.setdefault(name, []).extend(samples)
+    return merged
+
+
+def clear():
+    with _lock:
+        _samples.clear()
+    directory = _stats_dir()
+    if directory and os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if filename.endswith(".json"):
+                os.remove(os.path.join(directory, filename))
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of already sorted ``values``."""
+    index = max(0, -(-len(values) * p // 100) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def summary():
+    rows = []
+    for name, samples in sorted(load().items()):
+        row = {"name": name, "count": len(samples)}
+        for metric in METRICS:
+            values = sorted(sample[metric] for sample in samples)
+            row[metric] = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+        rows.append(row)
+    return rows
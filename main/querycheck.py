@@ -0,0 +1,196 @@
+"""
+N+1 query detection and per-view query budgets for development and tests.
+
+While a request runs, ``QueryCheckMiddleware`` records every SQL statement
+together with where it came from: the innermost template node being
+rendered (``main/post_card.html:33``) and the innermost frame of project
+code (``main/views.py:164``). Statements are grouped by their shape, the
+SQL with literals, parameters and ``IN`` lists collapsed. A shape that runs
+``QUERY_CHECK_REPEAT_THRESHOLD`` or more times in one request is reported
+as an N+1 pattern, since it is almost always a relation loaded once per row
+of a loop.
+
+Views declare how many queries a request may take with ``query_budget()``,
+see ``main.urls``. ``QUERY_CHECK`` selects what happens with problems:
+``"off"`` records nothing, ``"warn"`` logs them and ``"strict"`` raises
+``QueryCheckError``, which ``QueryCheckTestRunner`` turns on for the test
+suite so that regressions fail the tests.
+"""
+
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.base import Node
+from django.test.runner import DiscoverRunner
+
+logger = logging.getLogger(__name__)
+
+OFF, WARN, STRICT = "off", "warn", "strict"
+
+_current = ContextVar("query_log", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\bIN \((?:\?, )*\?\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+# Transaction control repeats with every atomic block.
+_IGNORED = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+
+_ROOT = str(settings.BASE_DIR) + os.sep
+# Plumbing every query passes through, which says nothing about its cause.
+_SKIPPED = {
+    os.path.join(os.path.dirname(__file__), f"{module}.py")
+    for module in ("db", "middleware", "perf", "querycheck", "routers")
+} | {os.path.join(_ROOT, "manage.py")}
+
+
+class QueryCheckError(AssertionError):
+    pass
+
+
+def normalize(sql):
+    """Return the shape of ``sql``: literals and parameter lists replaced."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def _is_project_file(filename):
+    return (
+        filename.startswith(_ROOT)
+        and "site-packages" not in filename
+        and filename not in _SKIPPED
+    )
+
+
+def _origin():
+    """Return the template line and the project code line running a query."""
+    template = code = None
+    frame = sys._getframe(2)
+    while frame is not None and (template is None or code is None):
+        if template is None and frame.f_code is Node.render_annotated.__code__:
+            node = frame.f_locals.get("self")
+            token = getattr(node, "token", None)
+            if token is not None:
+                template = f"{node.origin.template_name}:{token.lineno}"
+        elif code is None and _is_project_file(frame.f_code.co_filename):
+            filename = os.path.relpath(frame.f_code.co_filename, _ROOT)
+            code = f"{filename}:{frame.f_lineno}"
+        frame = frame.f_back
+    return template, code
+
+
+class QueryLog:
+    """The statements executed inside ``with record():``."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def add(self, sql):
+        if sql.lstrip().upper().startswith(_IGNORED):
+            return
+        template, code = _origin()
+        self.queries.append(
+            {"sql": sql, "shape": normalize(sql), "template": template, "code": code}
+        )
+
+    def repeated(self, threshold=None):
+        """Return ``[(shape, count, origins)]`` of shapes run ``threshold`` times."""
+        if threshold is None:
+            threshold = getattr(settings, "QUERY_CHECK_REPEAT_THRESHOLD", 3)
+        counts = Counter(query["shape"] for query in self.queries)
+        result = []
+        for shape, count in counts.most_common():
+            if count < threshold:
+                break
+            origins = Counter(
+                " via ".join(filter(None, (query["template"], query["code"])))
+                or "unknown"
+                for query in self.queries
+                if query["shape"] == shape
+            )
+            result.append((shape, count, origins))
+        return result
+
+    def problems(self, budget=None, threshold=None):
+        problems = []
+        if budget is not None and len(self) > budget:
+            problems.append(f"{len(self)} queries exceed the budget of {budget}.")
+        for shape, count, origins in self.repeated(threshold):
+            where = ", ".join(f"{origin} ({n}x)" for origin, n in origins.items())
+            problems.append(f"N+1: {count}x {shape}\n    from {where}")
+        return problems
+
+
+@contextmanager
+def record():
+    """Collect the queries run inside the block in a QueryLog."""
+    log = QueryLog()
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    log = _current.get()
+    if log is not None:
+        log.add(sql)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_execute_wrapper(sender, connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def mode():
+    return getattr(settings, "QUERY_CHECK", OFF)
+
+
+def query_budget(view, queries):
+    """Allow at most ``queries`` queries per request to ``view``."""
+    view.query_budget = queries
+    return view
+
+
+def check(log, budget=None, label="request"):
+    """Log or raise, depending on QUERY_CHECK, what ``log`` does wrong."""
+    problems = log.problems(budget)
+    if not problems:
+        return
+    message = f"{label}: " + "\n".join(problems)
+    if mode() == STRICT:
+        raise QueryCheckError(message)
+    logger.warning(message)
+
+
+class QueryCheckTestRunner(DiscoverRunner):
+    """
+    Run the tests with QUERY_CHECK set to strict, and with a cache of their
+    own rather than the shared one, which may hold entries of other runs.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_CHECK = STRICT
+        settings.CACHES = {
+            alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            for alias in settings.CACHES
+        }
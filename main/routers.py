@@ -0,0 +1,73 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary (``default``). Reads go to one of the
+aliases in ``DATABASE_REPLICAS`` only while ``use_replicas()`` is active,
+which ``main.middleware.replica_middleware`` does for safe requests of
+clients that have not written recently. The replica is picked once on
+entering ``use_replicas()``, so all reads of a request see the same lag.
+Everything else (POST requests, background jobs, management commands) reads
+from the primary, so code outside of views never sees replica lag.
+
+Caches that outlive a request should be filled inside ``primary()``, or a
+lagging replica could put stale data back right after an invalidation. The
+same holds for rendered post cards, so replicas should lag by less than
+``REPLICA_PIN_SECONDS``.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# The alias reads go to, None for the primary.
+_read_alias = ContextVar("read_alias", default=None)
+
+# Models whose rows are read back right after being written by another
+# request or process.
+PRIMARY_ONLY = {"sessions", "main.job", "main.mediablob"}
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    aliases = replicas() if enabled else []
+    token = _read_alias.set(random.choice(aliases) if aliases else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def primary():
+    return use_replicas(False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        alias = _read_alias.get()
+        if (
+            alias is None
+            or model._meta.app_label in PRIMARY_ONLY
+            or model._meta.label_lower in PRIMARY_ONLY
+        ):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,104 @@
+"""
+Full-text search over ``Post.note``.
+
+On SQLite builds with FTS5 the notes are mirrored into a trigram-tokenized
+virtual table, which matches substrings in any script (the notes are mostly
+Japanese, so word-based tokenizers do not help). Keywords shorter than a
+trigram, and databases without FTS5, use the plain ``icontains`` path.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = "main_post_fts"
+TRIGRAM = 3
+
+ORDER_DATE = "date"
+ORDER_RANK = "rank"
+
+_available = {}
+
+
+def fts_available(using="default"):
+    if using not in _available:
+        connection = connections[using]
+        _available[using] = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available[using]
+
+
+async def afts_available(using="default"):
+    if using not in _available:
+        await sync_to_async(fts_available)(using)
+    return _available[using]
+
+
+def index_post(post, using="default"):
+    if not fts_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, note) VALUES (%s, %s)",
+            [post.pk, post.note],
+        )
+
+
+def unindex_post(post_id, using="default"):
+    if not fts_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+
+def rebuild_index(using="default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, note) "
+            f"SELECT id, note FROM {Post._meta.db_table}"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def _phrase(word):
+    return '"%s"' % word.replace('"', '""')
+
+
+def search_posts(queryset, keyword, order=ORDER_DATE):
+    words = keyword.split()
+    if fts_available(queryset.db):
+        indexed = [word for word in words if len(word) >= TRIGRAM]
+    else:
+        indexed = []
+    for word in words:
+        if word not in indexed:
+            queryset = queryset.filter(note__icontains=word)
+    if not indexed:
+        return queryset.order_by("-post_date", "-id")
+
+    match = " ".join(_phrase(word) for word in indexed)
+    if order != ORDER_RANK:
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+            )
+        ).order_by("-post_date", "-id")
+    # A join runs the MATCH once, where a rank subquery would run it again
+    # for every matching post.
+    return queryset.extra(
+        select={"rank": f"{FTS_TABLE}.rank"},
+        tables=[FTS_TABLE],
+        where=[
+            f"{FTS_TABLE} MATCH %s",
+            f"{FTS_TABLE}.rowid = {Post._meta.db_table}.id",
+        ],
+        params=[match],
+    ).order_by("rank", "-post_date", "-id")
@@ -0,0 +1,247 @@
+"""
+Synthetic data for local load testing.
+
+Users, posts, follows and likes are written with ``bulk_create`` in batches
+straight into the model and through tables, so generating millions of rows
+stays linear and no per-row signals fire; the derived data (timelines,
+search indexes, like counts, media references) is rebuilt once at the end.
+Follow and like targets are drawn from Zipf-like popularity weights and the
+per-user counts from a Pareto distribution, which gives the heavy-tailed
+graph of a real social network. Post images come from a small pool, which
+the content-addressed storage stores once.
+"""
+
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import images
+from .models import Post, User
+
+BATCH_SIZE = 5000
+PASSWORD = "password"
+USERNAME_PREFIX = "seed"
+
+WORDS = (
+    "猫 犬 空 海 山 桜 紅葉 夕焼け 朝焼け カフェ ラーメン 寿司 旅行 散歩 "
+    "週末 休日 友達 家族 写真 東京 京都 大阪 北海道 花火 夏祭り 雪 雨 "
+    "coffee sunset travel cat dog beach mountain city night food friends "
+    "weekend morning flowers books music art street park river"
+).split()
+
+Follow = User.follow.through
+Like = User.like.through
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _pareto_counts(rng, n, mean, alpha=1.5, maximum=None):
+    """Return ``n`` heavy-tailed non-negative counts averaging about ``mean``."""
+    scale = mean * (alpha - 1) / alpha
+    counts = []
+    for _ in range(n):
+        count = int(scale * rng.paretovariate(alpha))
+        counts.append(min(count, maximum) if maximum is not None else count)
+    return counts
+
+
+def _zipf_cum_weights(n, exponent=1.0):
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+_explicit_lock = threading.Lock()
+_explicit_counts = Counter()
+_explicit_saved = {}
+
+
+@contextmanager
+def explicit_dates(model, *names):
+    """
+    Let ``bulk_create()`` keep the given values of auto_now(_add) fields.
+
+    The flags live on the fields shared by every thread, so overlapping
+    blocks are counted and the last one to exit restores them.
+    """
+    fields = [model._meta.get_field(name) for name in names]
+    with _explicit_lock:
+        for field in fields:
+            if not _explicit_counts[field]:
+                _explicit_saved[field] = (field.auto_now, field.auto_now_add)
+                field.auto_now = field.auto_now_add = False
+            _explicit_counts[field] += 1
+    try:
+        yield
+    finally:
+        with _explicit_lock:
+            for field in fields:
+                _explicit_counts[field] -= 1
+                if not _explicit_counts[field]:
+                    field.auto_now, field.auto_now_add = _explicit_saved.pop(field)
+
+
+def _image(rng, width, height):
+    image = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in "rgb"))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(width // 16, width // 3)
+        color = tuple(rng.randrange(256) for _ in "rgb")
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return ContentFile(buffer.getvalue())
+
+
+def create_image_pool(rng, size):
+    """Store ``size`` images with their variants; return ``[(name, variants)]``."""
+    field = Post._meta.get_field("img")
+    pool = []
+    for i in range(size):
+        width = rng.choice((800, 1080, 1440, 2048))
+        height = int(width * rng.choice((1, 1.25, 0.75, 0.5625)))
+        name = default_storage.save(f"posts/seed{i}.jpg", _image(rng, width, height))
+        variants = images.render_post_variants(FieldFile(None, field, name))
+        pool.append((name, variants))
+    return pool
+
+
+def create_users(rng, count, prefix=USERNAME_PREFIX, batch_size=BATCH_SIZE):
+    password = make_password(PASSWORD)
+    start = User.objects.filter(username__startswith=prefix).count()
+    users = (
+        User(
+            username=f"{prefix}{start + i:07d}",
+            email=f"{prefix}{start + i:07d}@example.com",
+            password=password,
+            profile=" ".join(rng.choices(WORDS, k=rng.randint(0, 6))),
+        )
+        for i in range(count)
+    )
+    user_ids = []
+    for batch in _batched(users, batch_size):
+        user_ids += [user.pk for user in User.objects.bulk_create(batch)]
+    return user_ids
+
+
+def create_posts(rng, user_ids, mean, pool, days=90, batch_size=BATCH_SIZE):
+    now = timezone.now()
+    counts = _pareto_counts(rng, len(user_ids), mean)
+
+    def posts():
+        for user_id, count in zip(user_ids, counts):
+            for _ in range(count):
+                name, variants = rng.choice(pool)
+                date = now - timedelta(seconds=rng.randrange(days * 24 * 60 * 60))
+                yield Post(
+                    user_id=user_id,
+                    img=name,
+                    img_variants=variants,
+                    note=" ".join(rng.choices(WORDS, k=rng.randint(1, 8))),
+                    post_date=date,
+                    updated_at=date,
+                )
+
+    post_ids = []
+    with explicit_dates(Post, "post_date", "updated_at"):
+        for batch in _batched(posts(), batch_size):
+            post_ids += [post.pk for post in Post.objects.bulk_create(batch)]
+    return post_ids
+
+
+def create_follows(rng, user_ids, mean, batch_size=BATCH_SIZE):
+    popular = user_ids[:]
+    rng.shuffle(popular)
+    cum_weights = _zipf_cum_weights(len(popular))
+    counts = _pareto_counts(rng, len(user_ids), mean, maximum=len(user_ids) - 1)
+
+    def rows():
+        for user_id, count in zip(user_ids, counts):
+            targets = set(rng.choices(popular, cum_weights=cum_weights, k=count))
+            targets.discard(user_id)
+            for target in targets:
+                yield Follow(from_user_id=user_id, to_user_id=target)
+
+    created = 0
+    for batch in _batched(rows(), batch_size):
+        Follow.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+    return created
+
+
+def create_likes(rng, user_ids, post_ids, mean, batch_size=BATCH_SIZE):
+    if not post_ids:
+        return 0
+    popular = post_ids[:]
+    rng.shuffle(popular)
+    cum_weights = _zipf_cum_weights(len(popular))
+    counts = _pareto_counts(rng, len(user_ids), mean, maximum=len(post_ids))
+
+    def rows():
+        for user_id, count in zip(user_ids, counts):
+            for post_id in set(rng.choices(popular, cum_weights=cum_weights, k=count)):
+                yield Like(user_id=user_id, post_id=post_id)
+
+    created = 0
+    for batch in _batched(rows(), batch_size):
+        Like.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+    return created
+
+
+def rebuild_derived(stdout=None):
+    for command in (
+        "reconcile_like_counts",
+        "reconcile_media_refs",
+        "rebuild_post_search_index",
+        "rebuild_username_index",
+        "rebuild_timeline",
+        "refresh_follow_suggestions",
+    ):
+        call_command(command, stdout=stdout)
+    # Cached feeds and follow graphs predate the inserted rows.
+    for cache in caches.all():
+        cache.clear()
+
+
+def seed(
+    users,
+    posts_per_user=10,
+    follows_per_user=50,
+    likes_per_user=100,
+    image_pool=20,
+    seed=None,
+    batch_size=BATCH_SIZE,
+    prefix=USERNAME_PREFIX,
+    stdout=None,
+):
+    rng = random.Random(seed)
+    pool = create_image_pool(rng, image_pool)
+    user_ids = create_users(rng, users, prefix, batch_size)
+    post_ids = create_posts(rng, user_ids, posts_per_user, pool, batch_size=batch_size)
+    follows = create_follows(rng, user_ids, follows_per_user, batch_size)
+    likes = create_likes(rng, user_ids, post_ids, likes_per_user, batch_size)
+    rebuild_derived(stdout)
+    return {
+        "users": len(user_ids),
+        "posts": len(post_ids),
+        "follows": follows,
+        "likes": likes,
+        "images": len(pool),
+    }
@@ -0,0 +1,121 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_post_delete
+
+from . import (
+    feedcache,
+    followgraph,
+    fragments,
+    images,
+    search,
+    suggestions,
+    tasks,
+    timeline,
+    usersearch,
+)
+from .models import Post, User
+
+
+@receiver(m2m_changed, sender=User.follow.through)
+def sync_follow_timeline(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        if reverse:
+            owner_ids, followee_ids = pk_set, [instance.pk]
+        else:
+            owner_ids, followee_ids = [instance.pk], pk_set
+        if action == "post_add":
+            timeline.backfill(owner_ids, followee_ids)
+        else:
+            timeline.prune(owner_ids, followee_ids)
+    elif action == "pre_clear":
+        if reverse:
+            owner_ids = instance.followed.values_list("id", flat=True)
+            timeline.prune(owner_ids, [instance.pk])
+        else:
+            followee_ids = instance.follow.values_list("id", flat=True)
+            timeline.prune([instance.pk], followee_ids)
+
+
+@receiver(m2m_changed, sender=User.follow.through)
+def invalidate_follow_graph(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        followgraph.invalidate([instance.pk, *pk_set])
+    elif action == "pre_clear":
+        if reverse:
+            other_ids = followgraph.followers(instance.pk)
+        else:
+            other_ids = followgraph.followees(instance.pk)
+        followgraph.invalidate([instance.pk, *other_ids])
+
+
+@receiver(m2m_changed, sender=User.follow.through)
+def refresh_follow_suggestions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        if reverse:
+            owner_ids, followee_ids = pk_set, [instance.pk]
+        else:
+            owner_ids, followee_ids = [instance.pk], pk_set
+        if action == "post_add":
+            suggestions.discard(owner_ids, followee_ids)
+    elif action == "pre_clear":
+        if reverse:
+            owner_ids = list(instance.followed.values_list("id", flat=True))
+        else:
+            owner_ids = [instance.pk]
+    else:
+        return
+    if owner_ids:
+        tasks.refresh_follow_suggestions.delay(user_ids=list(owner_ids))
+
+
+@receiver(post_save, sender=Post)
+def index_post_note(sender, instance, using, update_fields, **kwargs):
+    if update_fields is None or "note" in update_fields:
+        search.index_post(instance, using)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post_note(sender, instance, using, **kwargs):
+    search.unindex_post(instance.pk, using)
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, update_fields, **kwargs):
+    if update_fields is None or "username" in update_fields:
+        usersearch.index_user(instance)
+
+
+@receiver(cleanup_post_delete)
+def delete_image_variants(sender, file, file_name, field_name, success, **kwargs):
+    if (sender, field_name) not in ((Post, "img"), (User, "icon")):
+        return
+    # A deduplicated original may still be referenced by another post.
+    if success and not file.storage.exists(file_name):
+        images.delete_variants(file.storage, file_name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_card(sender, instance, **kwargs):
+    fragments.bump_post(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def bump_author_cards(sender, instance, update_fields, **kwargs):
+    if update_fields is None or {"username", "icon", "icon_variants"} & set(
+        update_fields
+    ):
+        fragments.bump_author(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_latest_feed(sender, instance, created, **kwargs):
+    if created:
+        feedcache.invalidate_latest()
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_feeds_with_post(sender, instance, **kwargs):
+    feedcache.invalidate_latest()
+    follower_ids = followgraph.followers(instance.user_id)
+    feedcache.invalidate_follow([instance.user_id, *follower_ids])
@@ -1,10 +1,13 @@
 !function () {
-    const menuList = document.getElementsByClassName("action-menu");
-    for (let i = 0, l = menuList.length; i < l; ++i) {
-        const menu = menuList[i];
-        const button = menu.parentElement;
-        button.addEventListener("click", function () {
+    // Delegated, so that cards added by infinite-scroll.js work as well.
+    document.addEventListener("click", function (e) {
+        const button = e.target.closest(".menu-button");
+        if (!button) {
+            return;
+        }
+        const menu = button.querySelector(".action-menu");
+        if (menu) {
             menu.classList.toggle("action-menu--active");
-        });
-    }
+        }
+    });
 }();
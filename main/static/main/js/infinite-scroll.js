@@ -0,0 +1,103 @@
+!function () {
+    const list = document.querySelector(".post-list[data-feed-url]");
+    const template = document.getElementById("post-card-template");
+    if (!list || !template || !("IntersectionObserver" in window)) {
+        return;
+    }
+    let cursor = list.getAttribute("data-next-cursor");
+    let loading = false;
+    // The link stays as the fallback when a page fails to load.
+    const nextLink = document.querySelector(".pagination__next");
+    if (nextLink) {
+        nextLink.hidden = true;
+    }
+    const sentinel = document.createElement("div");
+    list.after(sentinel);
+
+    function setAttribute(element, name, value) {
+        if (value) {
+            element.setAttribute(name, value);
+        } else {
+            element.removeAttribute(name);
+        }
+    }
+
+    function buildCard(post) {
+        const card = template.content.firstElementChild.cloneNode(true);
+        card.querySelector(".post__link").href = post["url"];
+        const source = card.querySelector("picture source");
+        if (post["image"]["webp_srcset"]) {
+            source.srcset = post["image"]["webp_srcset"];
+            source.sizes = post["image"]["sizes"];
+        } else {
+            source.remove();
+        }
+        const image = card.querySelector("picture img");
+        image.src = post["image"]["src"];
+        setAttribute(image, "srcset", post["image"]["srcset"]);
+        setAttribute(image, "sizes", post["image"]["srcset"] && post["image"]["sizes"]);
+        const deleteLink = card.querySelector(".post__delete");
+        if (post["delete_url"]) {
+            deleteLink.href = post["delete_url"];
+        } else {
+            deleteLink.remove();
+        }
+        const like = card.querySelector(".like");
+        like.setAttribute("data-id", post["id"]);
+        like.classList.toggle("like--active", post["liked"]);
+        card.querySelector(".like-count").textContent = post["like_count"];
+        const icon = card.querySelector(".user img");
+        icon.src = post["user"]["icon"];
+        setAttribute(icon, "srcset", post["user"]["icon_srcset"]);
+        card.querySelector(".user span").textContent = post["user"]["username"];
+        card.querySelector(".post__body").textContent = post["note"];
+        return card;
+    }
+
+    function load() {
+        if (loading || !cursor) {
+            return;
+        }
+        loading = true;
+        const url = new URL(list.getAttribute("data-feed-url"), location.href);
+        url.searchParams.set("cursor", cursor);
+        fetch(url, { headers: { "Accept": "application/json" } }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        }).then(function (result) {
+            const fragment = document.createDocumentFragment();
+            for (const post of result["posts"]) {
+                fragment.appendChild(buildCard(post));
+            }
+            list.appendChild(fragment);
+            cursor = result["next_cursor"];
+            // Observe again, so that a sentinel which is still in view
+            // triggers the next page.
+            observer.unobserve(sentinel);
+            if (cursor) {
+                observer.observe(sentinel);
+            }
+        }).catch(function () {
+            observer.disconnect();
+            if (nextLink) {
+                const next = new URL(nextLink.href);
+                next.searchParams.set("cursor", cursor);
+                nextLink.href = next;
+                nextLink.hidden = false;
+            }
+        }).finally(function () {
+            loading = false;
+        });
+    }
+
+    const observer = new IntersectionObserver(function (entries) {
+        if (entries.some(function (entry) { return entry.isIntersecting; })) {
+            load();
+        }
+    }, { rootMargin: "800px 0px" });
+    if (cursor) {
+        observer.observe(sentinel);
+    }
+}();
@@ -15,25 +15,72 @@
         return cookieValue;
     }
 
-    const likeIcons = document.getElementsByClassName("like");
     const csrftoken = getCookie('csrftoken');
-    for (let i = 0, l = likeIcons.length; i < l; ++i) {
-        const icon = likeIcons[i];
-        icon.addEventListener("click", function () {
-            const postId = icon.getAttribute("data-id");
-            url = `/like/${postId}`;
-            const xhr = new XMLHttpRequest();
-            xhr.open("POST", url, true);
-            xhr.setRequestHeader('X-CSRFToken', csrftoken);
-            xhr.onload = function (e) {
-                if (xhr.readyState === 4) {
-                    result = JSON.parse(xhr.responseText)
-                  if (xhr.status === 200 && result["result"] === "success") {
-                    icon.classList.toggle("like--active");
-                  }
+    const FLUSH_DELAY = 400;
+    // postId -> desired like state, coalesced until the next flush
+    const pending = new Map();
+    let timer = null;
+
+    function render(postId, liked, likeCount) {
+        const icons = document.querySelectorAll(`.like[data-id="${postId}"]`);
+        for (let i = 0, l = icons.length; i < l; ++i) {
+            const icon = icons[i];
+            const count = icon.parentElement.querySelector(".like-count");
+            if (count) {
+                if (likeCount === undefined) {
+                    const wasLiked = icon.classList.contains("like--active");
+                    likeCount = Number(count.textContent) + (liked === wasLiked ? 0 : liked ? 1 : -1);
+                }
+                count.textContent = likeCount;
+            }
+            icon.classList.toggle("like--active", liked);
+        }
+    }
+
+    function flush() {
+        timer = null;
+        if (pending.size === 0) {
+            return;
+        }
+        const likes = Array.from(pending, ([id, liked]) => ({ id: Number(id), liked: liked }));
+        pending.clear();
+        fetch("/like/batch", {
+            method: "POST",
+            keepalive: true,
+            headers: { "Content-Type": "application/json", "X-CSRFToken": csrftoken },
+            body: JSON.stringify({ likes: likes }),
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        }).then(function (result) {
+            for (const like of result["likes"]) {
+                if (!pending.has(String(like["id"]))) {
+                    render(like["id"], like["liked"], like["like_count"]);
+                }
+            }
+        }).catch(function () {
+            for (const like of likes) {
+                if (!pending.has(String(like.id))) {
+                    render(like.id, !like.liked);
                 }
-              };
-            xhr.send();
+            }
         });
     }
+
+    document.addEventListener("click", function (e) {
+        const icon = e.target.closest(".like");
+        if (!icon) {
+            return;
+        }
+        const postId = icon.getAttribute("data-id");
+        const liked = !icon.classList.contains("like--active");
+        render(postId, liked);
+        pending.set(postId, liked);
+        clearTimeout(timer);
+        timer = setTimeout(flush, FLUSH_DELAY);
+    });
+
+    window.addEventListener("pagehide", flush);
 }();
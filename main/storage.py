@@ -0,0 +1,110 @@
+"""
+Content-addressed media storage.
+
+Uploads are renamed after the SHA-256 of their bytes and sharded two levels
+deep (``posts/3f/a2/3fa2...e9.jpg``), so no directory grows past a few
+hundred entries and identical uploads share one file. Every save of an
+upload adds a reference in ``MediaBlob`` and every delete removes one; the
+file is only removed with the last reference. This keeps ``django_cleanup``
+working unchanged, since it deletes through ``storage.delete()``.
+
+Names that already follow the layout are stored verbatim and are not
+counted. These are derivatives such as the resized variants in
+``main.images``, whose names are derived from the original's hash. Files
+saved before this storage existed have no ``MediaBlob`` row and are
+deleted immediately, as before.
+"""
+
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+ADDRESSED_NAME = re.compile(
+    r"(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}[^/]*$"
+)
+
+
+def is_addressed(name):
+    return ADDRESSED_NAME.search(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        hexdigest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, hexdigest[:2], hexdigest[2:4], hexdigest + ext)
+
+    def get_available_name(self, name, max_length=None):
+        # Names are chosen in _save() from the content; collisions are
+        # deduplicated there rather than renamed.
+        return name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in content.chunks():
+                    f.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # Concurrent writers of the same name carry the same bytes, so
+            # whichever rename lands last is equally correct.
+            os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        if is_addressed(name):
+            self._write(name, content)
+            return name
+
+        name = self.content_name(name, content)
+        with transaction.atomic():
+            # The UPDATE takes SQLite's write lock first, so a concurrent
+            # delete of the last reference cannot remove the file between
+            # the existence check and the write below.
+            blob, created = MediaBlob.objects.get_or_create(name=name)
+            MediaBlob.objects.filter(pk=blob.pk).update(refs=F("refs") + 1)
+            if not self.exists(name):
+                self._write(name, content)
+                MediaBlob.objects.filter(pk=blob.pk).update(size=content.size)
+        return name
+
+    def delete(self, name):
+        from .models import MediaBlob
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            updated = MediaBlob.objects.filter(name=name, refs__gt=1).update(
+                refs=F("refs") - 1
+            )
+            if updated:
+                return
+            MediaBlob.objects.filter(name=name).delete()
+            super().delete(name)
+
+    def delete_derivative(self, name):
+        # Derivatives are never counted, see above.
+        super().delete(name)
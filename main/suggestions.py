@@ -0,0 +1,200 @@
+"""
+Precomputed "who to follow" suggestions.
+
+A user is suggested the people their followees follow, ranked by how many
+of their followees do so ("mutuals"), leaving out themselves and the people
+they already follow. Computing that per request is a two-hop join that
+explodes for users following popular accounts, so the top
+``FOLLOW_SUGGESTIONS_SIZE`` are stored in ``FollowSuggestion`` rows and
+pages only read those.
+
+``refresh_all()`` reads the follow table once into ``FollowGraph``, a
+compressed sparse row layout of two ``array('q')`` values (8 bytes per
+edge), hands it to a process pool and computes the users in shards of
+consecutive ids. The workers do not touch the database; the parent writes
+each shard's rows as its results come in.
+
+Follow changes are handled incrementally: the followed user leaves the
+follower's suggestions at once and the ``refresh_follow_suggestions`` job
+recomputes the follower's suggestions from the follow rows of the follower
+and their followees. Those are read from the database, never from the
+cache in ``main.followgraph``, which follow rows written without the
+``m2m_changed`` signal (bulk inserts, imports) leave stale. The users two
+hops away, whose mutual counts shift as well, catch up with the next
+``refresh_all()``.
+"""
+
+import heapq
+import os
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .db import retry_on_locked
+from .models import FollowSuggestion, User
+
+Follow = User.follow.through
+
+SHARD_SIZE = 1000
+
+_graph = None
+
+
+def size():
+    return getattr(settings, "FOLLOW_SUGGESTIONS_SIZE", 20)
+
+
+class FollowGraph:
+    """
+    Followee ids of every user: those of user ``i`` are
+    ``targets[offsets[i]:offsets[i + 1]]``, in ascending order.
+    """
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        max_id = User.objects.aggregate(max=Max("pk"))["max"] or 0
+        offsets = array("q", bytes(8 * (max_id + 2)))
+        targets = array("q")
+        edges = (
+            Follow.objects.order_by("from_user_id", "to_user_id")
+            .values_list("from_user_id", "to_user_id")
+            .iterator(chunk_size=chunk_size)
+        )
+        for from_id, to_id in edges:
+            offsets[from_id + 1] += 1
+            targets.append(to_id)
+        for i in range(1, len(offsets)):
+            offsets[i] += offsets[i - 1]
+        return cls(offsets, targets)
+
+    def followees(self, user_id):
+        if user_id + 1 >= len(self.offsets):
+            return array("q")
+        return self.targets[self.offsets[user_id] : self.offsets[user_id + 1]]
+
+
+def suggest(user_id, followees, limit):
+    """
+    Return the top ``limit`` ``(suggested_id, mutuals)`` of ``user_id``;
+    ``followees(id)`` returns the sorted followee ids of a user.
+    """
+    own = followees(user_id)
+    mutuals = Counter()
+    for followee_id in own:
+        mutuals.update(followees(followee_id))
+    mutuals.pop(user_id, None)
+    for followee_id in own:
+        mutuals.pop(followee_id, None)
+    return heapq.nsmallest(limit, mutuals.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+
+def _suggest_shard(user_ids, limit):
+    return [
+        (user_id, suggest(user_id, _graph.followees, limit)) for user_id in user_ids
+    ]
+
+
+@retry_on_locked
+def _store(results):
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(
+            user_id__in=[user_id for user_id, _ in results]
+        ).delete()
+        FollowSuggestion.objects.bulk_create(
+            [
+                FollowSuggestion(
+                    user_id=user_id, suggested_id=suggested_id, mutuals=mutuals
+                )
+                for user_id, top in results
+                for suggested_id, mutuals in top
+            ]
+        )
+
+
+def _load_followees(user_ids, batch_size=500):
+    """Return ``{user_id: sorted followee ids}`` read from the follow table."""
+    adjacency = {}
+    user_ids = iter(sorted(user_ids))
+    while batch := list(islice(user_ids, batch_size)):
+        edges = (
+            Follow.objects.filter(from_user_id__in=batch)
+            .order_by("from_user_id", "to_user_id")
+            .values_list("from_user_id", "to_user_id")
+        )
+        for from_id, to_id in edges:
+            adjacency.setdefault(from_id, array("q")).append(to_id)
+    return adjacency
+
+
+def refresh(user_ids):
+    """Recompute the suggestions of ``user_ids`` from the follow table."""
+    user_ids = list(user_ids)
+    adjacency = _load_followees(user_ids)
+    second = {i for ids in adjacency.values() for i in ids} - adjacency.keys()
+    adjacency.update(_load_followees(second))
+    empty = array("q")
+
+    def followees(user_id):
+        return adjacency.get(user_id, empty)
+
+    _store([(user_id, suggest(user_id, followees, size())) for user_id in user_ids])
+
+
+def discard(user_ids, suggested_ids):
+    """Drop ``suggested_ids`` from the suggestions of ``user_ids``."""
+    FollowSuggestion.objects.filter(
+        user_id__in=user_ids, suggested_id__in=suggested_ids
+    ).delete()
+
+
+def _shards(shard_size):
+    user_ids = User.objects.order_by("pk").values_list("pk", flat=True).iterator()
+    while shard := list(islice(user_ids, shard_size)):
+        yield shard
+
+
+def refresh_all(workers=None, shard_size=SHARD_SIZE):
+    """
+    Recompute the suggestions of every user; return the number of users and
+    of stored suggestions.
+    """
+    graph = FollowGraph.load()
+    shards = list(_shards(shard_size))
+    workers = workers or os.cpu_count() or 1
+    users = stored = 0
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(graph,)
+    ) as pool:
+        for results in pool.map(_suggest_shard, shards, [size()] * len(shards)):
+            _store(results)
+            users += len(results)
+            stored += sum(len(top) for _, top in results)
+    return users, stored
+
+
+def for_user(user, limit):
+    """The top ``limit`` suggested users of ``user``, with ``mutuals`` set."""
+    rows = (
+        FollowSuggestion.objects.filter(user=user)
+        .select_related("suggested")
+        .order_by("-mutuals", "suggested_id")[:limit]
+    )
+    suggested = []
+    for row in rows:
+        row.suggested.mutuals = row.mutuals
+        suggested.append(row.suggested)
+    return suggested
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.utils import timezone
+
+from . import images, jobs, suggestions, trending
+from .models import Job, Post, User
+
+
+def mark_post_failed(post_id):
+    Post.objects.filter(pk=post_id).update(
+        status=Post.FAILED, updated_at=timezone.now()
+    )
+
+
+@jobs.task("process_post_image", on_failure=mark_post_failed)
+def process_post_image(post_id):
+    try:
+        post = Post.objects.get(pk=post_id)
+    except Post.DoesNotExist:
+        return
+    images.generate_post_variants(post)
+    Post.objects.filter(pk=post_id).update(status=Post.READY, updated_at=timezone.now())
+
+
+@jobs.task("process_user_icon")
+def process_user_icon(user_id):
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return
+    images.generate_icon_variants(user)
+
+
+@jobs.task("refresh_follow_suggestions")
+def refresh_follow_suggestions(user_ids):
+    suggestions.refresh(user_ids)
+
+
+@jobs.task("compact_trending")
+def compact_trending():
+    trending.compact()
+    schedule_trending_compaction()
+
+
+def schedule_trending_compaction():
+    """Queue the next ``compact_trending`` run unless one is queued already."""
+    # Eager jobs would run the next compaction right away, forever.
+    if getattr(settings, "JOBS_EAGER", False):
+        return None
+    if Job.objects.filter(task=compact_trending.name, status=Job.QUEUED).exists():
+        return None
+    interval = getattr(settings, "TRENDING_COMPACT_INTERVAL", 86400)
+    return jobs.enqueue(compact_trending.name, delay=interval)
@@ -10,5 +10,5 @@ def update_queryparams(context, **kwargs):
         if v is not None:
             q[k] = v
         else:
-            del q[k]
+            q.pop(k, None)
     return q.urlencode()
@@ -1,3 +1,1139 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import include, path, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from . import (
+    feedcache,
+    followgraph,
+    images,
+    jobs,
+    likes,
+    middleware,
+    perf,
+    querycheck,
+    routers,
+    search,
+    seeding,
+    suggestions,
+    tasks,
+    timeline,
+    transfer,
+    trending,
+)
+from .models import (
+    FollowSuggestion,
+    Job,
+    LikeEvent,
+    MediaBlob,
+    Post,
+    TimelineEntry,
+    TrendingEpoch,
+    User,
+)
+from .pagination import CursorPaginator, InvalidCursor
+from . import views
+from .views import MediaView, PostListView
+
+
+class NormalizeTests(TestCase):
+    def test_literals_and_in_lists_collapse(self):
+        self.assertEqual(
+            querycheck.normalize(
+                'SELECT "main_post"."id" FROM "main_post"  WHERE "id" IN '
+                "(%s, %s, %s) AND \"note\" = 'it''s' LIMIT 21"
+            ),
+            'SELECT "main_post"."id" FROM "main_post" WHERE "id" IN (...) '
+            'AND "note" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            querycheck.normalize("SELECT * FROM t WHERE id IN (%s)"),
+            querycheck.normalize("SELECT * FROM t WHERE id IN (%s, %s)"),
+        )
+
+
+class QueryCheckTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(f"user{i}", f"user{i}@example.com", "password")
+            for i in range(4)
+        ]
+        cls.viewer = cls.users[0]
+        cls.viewer.follow.add(*cls.users[1:])
+        cls.posts = [
+            Post.objects.create(user=user, img=f"posts/{i}.jpg", note=f"note {i}")
+            for i, user in enumerate(cls.users * 2)
+        ]
+        likes.set_likes(cls.viewer, {post.id: True for post in cls.posts[::2]})
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+
+    def test_repeated_shape_is_reported_with_its_origin(self):
+        with querycheck.record() as log:
+            usernames = [post.user.username for post in Post.objects.all()]
+        self.assertEqual(len(usernames), len(self.posts))
+        [(shape, count, origins)] = log.repeated()
+        self.assertEqual(count, len(self.posts))
+        self.assertIn('FROM "main_user"', shape)
+        [origin] = origins
+        self.assertRegex(origin, r"^main/tests\.py:\d+$")
+
+    def test_template_line_is_reported(self):
+        from django.template.loader import render_to_string
+
+        posts = list(Post.objects.all())
+        with querycheck.record() as log:
+            render_to_string(
+                "main/post_card.html", {"post": posts[0], "user": self.viewer}
+            )
+            for post in posts[1:]:
+                render_to_string("main/post_card.html", {"post": post})
+        [(shape, count, origins)] = log.repeated()
+        self.assertTrue(all(o.startswith("main/post_card.html:") for o in origins))
+
+    def test_strict_mode_raises(self):
+        with querycheck.record() as log:
+            list(User.objects.all())
+        with override_settings(QUERY_CHECK=querycheck.STRICT):
+            querycheck.check(log, budget=1)
+            with self.assertRaises(querycheck.QueryCheckError):
+                querycheck.check(log, budget=0)
+
+    def test_views_stay_within_budget(self):
+        # The test runner sets QUERY_CHECK to strict, so any N+1 pattern or
+        # exceeded budget fails the request.
+        post = self.posts[-1]
+        urls = [
+            reverse("home"),
+            reverse("home") + "?follow",
+            reverse("home") + "?trending",
+            reverse("home_api"),
+            reverse("home_api") + "?follow",
+            reverse("home_api") + "?trending",
+            reverse("post_detail", args=[post.id]),
+            reverse("settings"),
+            reverse("edit_profile", args=[self.viewer.id]),
+            reverse("search") + "?keyword=user",
+            reverse("search") + "?post&keyword=note",
+            reverse("user_typeahead") + "?q=user",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(reverse("like", args=[post.id]), {"state": "1"})
+        self.assertEqual(response.json()["changed"], True)
+        response = self.client.post(
+            reverse("like_batch"),
+            json.dumps(
+                {
+                    "likes": [{"id": p.id, "liked": False} for p in self.posts]
+                    + [{"id": 0, "liked": True}]
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["missing"], [0])
+        self.assertFalse(Post.objects.filter(like_count__gt=0).exists())
+
+    def test_like_api_rejects_bad_input_without_breaking_the_transaction(self):
+        response = self.client.post(reverse("like", args=[0]))
+        self.assertEqual(response.json()["result"], "DoesNotExist")
+        like = reverse("like", args=[self.posts[1].id])
+        self.client.post(like, {"state": "on"})
+        for state in ("yes", "", "2"):
+            response = self.client.post(like, {"state": state})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(like, {"state": "FALSE"})
+        self.assertEqual(response.json()["liked"], False)
+        self.assertEqual(response.json()["changed"], True)
+        # The outer test transaction must still be usable.
+        self.assertTrue(Post.objects.exists())
+        response = self.client.post(
+            reverse("like_batch"),
+            json.dumps({"likes": [{"id": self.posts[1].id, "liked": "false"}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_post_by_id(self):
+        confirm = {"confirm": "on"}
+        other = reverse("delete_post", args=[self.posts[1].id])
+        self.assertEqual(self.client.post(other, confirm).status_code, 404)
+        url = reverse("delete_post", args=[self.posts[0].id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertRedirects(self.client.post(url, confirm), reverse("home"))
+        self.assertFalse(Post.objects.filter(pk=self.posts[0].id).exists())
+
+    def test_budget_exceeded_fails_the_request(self):
+        view = reverse("post_detail", args=[self.posts[0].id])
+        match = self.client.get(view).resolver_match
+        budget = match.func.query_budget
+        try:
+            match.func.query_budget = 0
+            with self.assertRaises(querycheck.QueryCheckError):
+                self.client.get(view)
+        finally:
+            match.func.query_budget = budget
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("author", "author@example.com", "pw")
+        cls.posts = [
+            Post.objects.create(user=cls.user, img=f"posts/{i}.jpg") for i in range(5)
+        ]
+        # Ties on the date are broken by the id.
+        Post.objects.update(post_date=cls.posts[0].post_date)
+
+    def ids(self, page):
+        return [post.id for post in page]
+
+    def test_next_and_previous_cursors(self):
+        newest = [post.id for post in reversed(self.posts)]
+        paginator = CursorPaginator(Post.objects.all(), 2)
+        first = paginator.page()
+        self.assertEqual(self.ids(first), newest[:2])
+        self.assertFalse(first.has_previous())
+        second = paginator.page(first.next_cursor)
+        self.assertEqual(self.ids(second), newest[2:4])
+        last = paginator.page(second.next_cursor)
+        self.assertEqual(self.ids(last), newest[4:])
+        self.assertFalse(last.has_next())
+        back = paginator.page(last.previous_cursor)
+        self.assertEqual(self.ids(back), newest[2:4])
+        self.assertTrue(back.has_next())
+        back = paginator.page(back.previous_cursor)
+        self.assertEqual(self.ids(back), newest[:2])
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(Post.objects.all(), 2)
+        for cursor in ("garbage", "eHx5fHo", "bnwyMDI2fDE"):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("home"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+
+failures = []
+
+
+@jobs.task("tests.flaky", on_failure=lambda fail: failures.append(fail))
+def flaky(fail):
+    if fail:
+        raise RuntimeError("flaky")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        failures.clear()
+
+    def expire(self, **fields):
+        # Move the job's timestamps back instead of waiting.
+        past = timezone.now() - timedelta(seconds=1)
+        Job.objects.update(**{field: past for field in fields})
+
+    def test_failures_back_off_until_the_last_attempt(self):
+        job = flaky.delay(fail=True)
+        for attempt, delay in ((1, 10), (2, 20)):
+            before = timezone.now()
+            [claimed] = jobs.claim(1)
+            self.assertEqual(claimed.attempts, attempt)
+            with self.assertLogs("main.jobs", "ERROR"):
+                self.assertFalse(jobs.run(claimed))
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.QUEUED)
+            self.assertIn("RuntimeError", job.last_error)
+            self.assertGreaterEqual(job.run_after, before + timedelta(seconds=delay))
+            self.assertLess(job.run_after, before + timedelta(seconds=delay + 5))
+            self.assertEqual(jobs.claim(1), [])
+            self.expire(run_after=True)
+        [claimed] = jobs.claim(1)
+        with self.assertLogs("main.jobs", "ERROR"):
+            jobs.run(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertEqual(failures, [True])
+
+    def test_expired_lease_is_claimed_again(self):
+        flaky.delay(fail=False)
+        [first] = jobs.claim(1)
+        self.assertEqual(jobs.claim(1), [])
+        self.expire(locked_until=True)
+        [second] = jobs.claim(1)
+        self.assertEqual((second.pk, second.attempts), (first.pk, 2))
+
+    def test_stale_lease_holder_cannot_settle_the_job(self):
+        job = flaky.delay(fail=False)
+        [stale] = jobs.claim(1)
+        self.expire(locked_until=True)
+        [current] = jobs.claim(1)
+        self.assertTrue(jobs.run(stale))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 2))
+        self.assertTrue(jobs.run(current))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+
+class PerfStatsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(PERF_STATS_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        perf.clear()
+
+    def write(self, pid, name, age=0):
+        path = os.path.join(self.directory, f"{pid}.json")
+        with open(path, "w") as f:
+            json.dump({name: [{"total": 1}]}, f)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_files_of_exited_or_idle_processes_are_left_out(self):
+        exited = subprocess.run(
+            [sys.executable, "-c", "import os; print(os.getpid())"],
+            capture_output=True,
+            text=True,
+        )
+        dead = self.write(int(exited.stdout), "dead")
+        self.write(os.getppid(), "live")
+        idle = self.write(1, "idle", age=7200)
+        self.assertEqual(set(perf.load()), {"live"})
+        self.assertFalse(os.path.exists(dead))
+        self.assertTrue(os.path.exists(idle))
+
+
+@override_settings(TRENDING_HALF_LIFE=3600)
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(f"user{i}", f"user{i}@example.com", "password")
+            for i in range(3)
+        ]
+        cls.posts = [
+            Post.objects.create(user=cls.users[0], img=f"posts/{i}.jpg")
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        # The migration set the epoch when the test database was created;
+        # weights of likes now are 1 only against an epoch of now.
+        TrendingEpoch.objects.update(epoch=timezone.now())
+
+    def score(self, post):
+        post.refresh_from_db()
+        return post.trending_score
+
+    def test_unlike_takes_back_the_like(self):
+        post = self.posts[0]
+        likes.set_like(self.users[1], post.id, True)
+        likes.toggle_like(self.users[2], post.id)
+        self.assertAlmostEqual(self.score(post), 2, places=2)
+        likes.set_likes(self.users[1], {post.id: False})
+        likes.toggle_like(self.users[2], post.id)
+        self.assertAlmostEqual(self.score(post), 0)
+        self.assertEqual(LikeEvent.objects.filter(post=post).count(), 4)
+
+    def test_newer_likes_weigh_more_until_compacted(self):
+        old, new, _ = self.posts
+        likes.set_like(self.users[1], old.id, True)
+        likes.set_like(self.users[2], old.id, True)
+        # Two likes two half-lives ago are worth half of one like now.
+        TrendingEpoch.objects.update(epoch=F("epoch") - timedelta(hours=2))
+        likes.set_like(self.users[1], new.id, True)
+        self.assertAlmostEqual(self.score(old) / self.score(new), 0.5, places=2)
+        self.assertEqual(trending.top(Post.objects.all(), 10), [new, old])
+
+        trending.compact()
+        self.assertAlmostEqual(self.score(new), 1, places=2)
+        self.assertAlmostEqual(self.score(old), 0.5, places=2)
+        # Unliking after compaction takes back the rescaled weight.
+        likes.set_like(self.users[1], new.id, False)
+        self.assertAlmostEqual(self.score(new), 0)
+
+    def test_an_old_epoch_is_compacted_instead_of_overflowing(self):
+        post = self.posts[0]
+        likes.set_like(self.users[1], post.id, True)
+        TrendingEpoch.objects.update(epoch=F("epoch") - timedelta(hours=2000))
+        self.assertEqual(trending.top(Post.objects.all(), 10), [])
+        likes.set_like(self.users[2], post.id, True)
+        self.assertAlmostEqual(self.score(post), 1, places=2)
+        self.assertEqual(trending.top(Post.objects.all(), 10), [post])
+
+    def test_first_like_stays_within_budget(self):
+        # The epoch row comes with the migrations, not with the first like.
+        self.assertTrue(TrendingEpoch.objects.exists())
+        self.client.force_login(self.users[1])
+        response = self.client.post(
+            reverse("like", args=[self.posts[0].id]), {"state": "1"}
+        )
+        self.assertEqual(response.json()["changed"], True)
+
+    def test_decayed_posts_drop_out(self):
+        post = self.posts[0]
+        likes.set_like(self.users[1], post.id, True)
+        self.assertEqual(trending.top(Post.objects.all(), 10), [post])
+        TrendingEpoch.objects.update(epoch=F("epoch") - timedelta(hours=4))
+        with override_settings(TRENDING_MIN_SCORE=0.1):
+            self.assertEqual(trending.top(Post.objects.all(), 10), [])
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob, self.carol = [
+            User.objects.create_user(name, f"{name}@example.com", "password")
+            for name in ("alice", "bob", "carol")
+        ]
+
+    def post(self, user):
+        post = Post.objects.create(user=user, img="posts/p.jpg")
+        timeline.fan_out(post)
+        return post
+
+    def entries(self, owner):
+        return set(
+            TimelineEntry.objects.filter(owner=owner).values_list("post_id", flat=True)
+        )
+
+    def test_new_posts_fan_out_to_the_author_and_followers(self):
+        self.alice.follow.add(self.bob)
+        post = self.post(self.bob)
+        self.assertEqual(self.entries(self.alice), {post.id})
+        self.assertEqual(self.entries(self.bob), {post.id})
+        self.assertEqual(self.entries(self.carol), set())
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        own, bobs = self.post(self.alice), self.post(self.bob)
+        self.alice.follow.add(self.bob)
+        self.assertEqual(self.entries(self.alice), {own.id, bobs.id})
+        self.alice.follow.remove(self.bob)
+        self.assertEqual(self.entries(self.alice), {own.id})
+        # From the followed side.
+        self.bob.followed.add(self.alice, self.carol)
+        self.assertEqual(self.entries(self.carol), {bobs.id})
+        self.bob.followed.remove(self.carol)
+        self.assertEqual(self.entries(self.carol), set())
+        self.assertEqual(self.entries(self.alice), {own.id, bobs.id})
+
+    def test_clear_prunes_from_either_side(self):
+        bobs, carols = self.post(self.bob), self.post(self.carol)
+        self.alice.follow.add(self.bob, self.carol)
+        self.carol.follow.add(self.bob)
+        self.alice.follow.clear()
+        self.assertEqual(self.entries(self.alice), set())
+        self.bob.followed.clear()
+        self.assertEqual(self.entries(self.carol), {carols.id})
+        self.assertEqual(self.entries(self.bob), {bobs.id})
+
+    def test_rebuild_timeline_restores_entries(self):
+        self.alice.follow.add(self.bob)
+        own, bobs = self.post(self.alice), self.post(self.bob)
+        self.post(self.carol)
+        TimelineEntry.objects.all().delete()
+        call_command("rebuild_timeline", self.alice.id, stdout=io.StringIO())
+        self.assertEqual(self.entries(self.alice), {own.id, bobs.id})
+        self.assertEqual(self.entries(self.bob), set())
+        call_command("rebuild_timeline", stdout=io.StringIO())
+        self.assertEqual(self.entries(self.bob), {bobs.id})
+
+
+class SearchTests(TestCase):
+    NOTES = [
+        "今日のカフェはとても静か",
+        "カフェラテと朝の散歩",
+        "Sunset over the harbour",
+        "the harbour at night, sunset",
+        "雨の日の読書",
+        "",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("author", "author@example.com", "pw")
+        for note in cls.NOTES:
+            Post.objects.create(user=cls.user, img="posts/p.jpg", note=note)
+
+    def search(self, keyword, order=search.ORDER_DATE):
+        return search.search_posts(Post.objects.all(), keyword, order)
+
+    def contains(self, *words):
+        queryset = Post.objects.all()
+        for word in words:
+            queryset = queryset.filter(note__icontains=word)
+        return set(queryset.values_list("id", flat=True))
+
+    def test_index_matches_icontains(self):
+        self.assertTrue(search.fts_available())
+        for words in (
+            ["カフェ"],
+            ["HARBOUR"],
+            ["sunset", "harbour"],
+            ["散歩", "カフェ"],
+        ):
+            for order in (search.ORDER_DATE, search.ORDER_RANK):
+                with self.subTest(words=words, order=order):
+                    queryset = self.search(" ".join(words), order)
+                    self.assertIn(search.FTS_TABLE, str(queryset.query))
+                    ids = [post.id for post in queryset]
+                    self.assertEqual(set(ids), self.contains(*words))
+                    self.assertEqual(len(ids), len(set(ids)))
+
+    def test_short_keywords_fall_back_to_icontains(self):
+        for keyword, words in (("雨", ["雨"]), ("散歩 の", ["散歩", "の"])):
+            with self.subTest(keyword=keyword):
+                queryset = self.search(keyword)
+                self.assertNotIn(search.FTS_TABLE, str(queryset.query))
+                self.assertEqual({post.id for post in queryset}, self.contains(*words))
+
+    def test_index_follows_saves_and_deletes(self):
+        post = Post.objects.create(user=self.user, img="posts/p.jpg", note="紅葉の山道")
+        self.assertEqual(list(self.search("紅葉の山")), [post])
+        post.note = "新緑の山道"
+        post.save(update_fields=["note"])
+        self.assertEqual(list(self.search("紅葉の山")), [])
+        self.assertEqual(list(self.search("新緑の")), [post])
+        post_id = post.id
+        post.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {search.FTS_TABLE} WHERE rowid = %s", [post_id]
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_ranked_search_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("search"), {"post": "", "keyword": "harbour", "order": "rank"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {post.id for post in response.context["object_list"]},
+            self.contains("harbour"),
+        )
+
+
+class FeedCacheTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.alice, self.bob, self.carol = [
+            User.objects.create_user(name, f"{name}@example.com", "password")
+            for name in ("alice", "bob", "carol")
+        ]
+        self.client.force_login(self.alice)
+
+    def post(self, user):
+        post = Post.objects.create(user=user, img="posts/p.jpg")
+        timeline.fan_out(post)
+        return post
+
+    def feed(self, *params):
+        response = self.client.get(reverse("home") + "?" + "&".join(params))
+        return [post.id for post in response.context["post_list"]]
+
+    def cached(self, key):
+        return feedcache.get(key, PostListView.paginate_by) is not None
+
+    def test_followee_post_drops_the_follow_feed(self):
+        self.alice.follow.add(self.bob)
+        self.assertEqual(self.feed("follow"), [])
+        self.assertTrue(self.cached(feedcache.follow_key(self.alice.id)))
+        post = self.post(self.bob)
+        self.assertFalse(self.cached(feedcache.follow_key(self.alice.id)))
+        self.assertEqual(self.feed("follow"), [post.id])
+
+    def test_new_post_drops_the_latest_feed(self):
+        self.assertEqual(self.feed(), [])
+        self.assertTrue(self.cached(feedcache.LATEST_KEY))
+        post = self.post(self.carol)
+        self.assertFalse(self.cached(feedcache.LATEST_KEY))
+        self.assertEqual(self.feed(), [post.id])
+
+    def test_follow_and_unfollow_drop_the_follow_feed(self):
+        post = self.post(self.bob)
+        self.assertEqual(self.feed("follow"), [])
+        self.alice.follow.add(self.bob)
+        self.assertFalse(self.cached(feedcache.follow_key(self.alice.id)))
+        self.assertEqual(self.feed("follow"), [post.id])
+        self.alice.follow.remove(self.bob)
+        self.assertFalse(self.cached(feedcache.follow_key(self.alice.id)))
+        self.assertEqual(self.feed("follow"), [])
+
+    def test_deleted_post_drops_latest_and_follower_feeds(self):
+        self.alice.follow.add(self.bob)
+        self.carol.follow.add(self.bob)
+        post = self.post(self.bob)
+        self.assertEqual(self.feed(), [post.id])
+        self.assertEqual(self.feed("follow"), [post.id])
+        self.client.force_login(self.carol)
+        self.assertEqual(self.feed("follow"), [post.id])
+        post.delete()
+        for key in (
+            feedcache.LATEST_KEY,
+            feedcache.follow_key(self.alice.id),
+            feedcache.follow_key(self.bob.id),
+            feedcache.follow_key(self.carol.id),
+        ):
+            self.assertFalse(self.cached(key), key)
+        self.assertEqual(self.feed("follow"), [])
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.alice, self.bob, self.carol = [
+            User.objects.create_user(name, f"{name}@example.com", "password")
+            for name in ("alice", "bob", "carol")
+        ]
+
+    def graph(self, user):
+        return list(followgraph.followees(user.id)), list(
+            followgraph.followers(user.id)
+        )
+
+    def test_follow_changes_invalidate_both_endpoints(self):
+        self.graph(self.alice), self.graph(self.bob)
+        self.alice.follow.add(self.bob, self.carol)
+        self.assertEqual(self.graph(self.alice), ([self.bob.id, self.carol.id], []))
+        self.assertEqual(self.graph(self.bob), ([], [self.alice.id]))
+        self.bob.followed.add(self.carol)
+        self.assertEqual(self.graph(self.bob), ([], [self.alice.id, self.carol.id]))
+        self.alice.follow.remove(self.bob)
+        self.assertEqual(self.graph(self.alice), ([self.carol.id], []))
+        self.assertEqual(self.graph(self.bob), ([], [self.carol.id]))
+
+    def test_clear_invalidates_from_either_side(self):
+        self.alice.follow.add(self.bob, self.carol)
+        self.carol.follow.add(self.bob)
+        for user in (self.alice, self.bob, self.carol):
+            self.graph(user)
+        self.alice.follow.clear()
+        self.assertEqual(self.graph(self.alice), ([], []))
+        self.assertEqual(self.graph(self.carol), ([self.bob.id], []))
+        self.bob.followed.clear()
+        self.assertEqual(self.graph(self.carol), ([], []))
+        self.assertEqual(self.graph(self.bob), ([], []))
+
+    def test_typeahead_flags_followees(self):
+        self.client.force_login(self.alice)
+        url = reverse("user_typeahead")
+        self.client.get(url, {"q": "bo"})
+        self.alice.follow.add(self.bob)
+        users = self.client.get(url, {"q": "bo"}).json()["users"]
+        self.assertEqual(
+            [(u["username"], u["is_follow"]) for u in users], [("bob", True)]
+        )
+
+
+class SuggestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        a, b, c, d, e = cls.users = [
+            User.objects.create_user(name, f"{name}@example.com", "password")
+            for name in "abcde"
+        ]
+        a.follow.add(b, c)
+        b.follow.add(a, d, e)
+        c.follow.add(d)
+
+    def suggested(self, user):
+        return list(
+            FollowSuggestion.objects.filter(user=user)
+            .order_by("-mutuals", "suggested_id")
+            .values_list("suggested__username", "mutuals")
+        )
+
+    def test_refresh_all_ranks_by_mutual_follows(self):
+        a, b, c, d, e = self.users
+        self.assertEqual(suggestions.refresh_all(workers=2, shard_size=2), (5, 3))
+        self.assertEqual(self.suggested(a), [("d", 2), ("e", 1)])
+        self.assertEqual(self.suggested(b), [("c", 1)])
+        self.assertEqual(self.suggested(c), [])
+        self.client.force_login(a)
+        response = self.client.get(reverse("settings"))
+        self.assertEqual(
+            [user.username for user in response.context["follow_suggestions"]],
+            ["d", "e"],
+        )
+
+    def test_follows_refresh_incrementally(self):
+        a, b, c, d, e = self.users
+        suggestions.refresh_all(workers=1)
+        Job.objects.all().delete()
+        a.follow.add(d)
+        self.assertEqual(self.suggested(a), [("e", 1)])
+        [job] = Job.objects.filter(task=tasks.refresh_follow_suggestions.name)
+        self.assertEqual(job.payload, {"user_ids": [a.id]})
+        c.follow.add(e)
+        tasks.refresh_follow_suggestions(user_ids=[a.id])
+        self.assertEqual(self.suggested(a), [("e", 2)])
+
+    def test_refresh_ignores_the_cached_follow_graph(self):
+        # Follow rows written directly, as bulk inserts and imports do, skip
+        # the signals that invalidate the cache.
+        a, b, c, d, e = self.users
+        followgraph.followees(a.id)
+        User.follow.through.objects.create(from_user=a, to_user=d)
+        suggestions.refresh([a.id])
+        self.assertEqual(self.suggested(a), [("e", 1)])
+
+
+def image_upload(name="image.png", color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class RouterTests(TestCase):
+    def route(self, request, model=Post):
+        """Return the aliases the router picks for reads and writes."""
+        router = routers.PrimaryReplicaRouter()
+        routes = []
+
+        def view(request):
+            for _ in range(10):
+                routes.append((router.db_for_read(model), router.db_for_write(model)))
+            return HttpResponse()
+
+        self.response = middleware.replica_middleware(view)(request)
+        self.assertEqual(len(set(routes)), 1, routes)
+        return routes[0]
+
+    def test_write_goes_to_primary_and_pins(self):
+        request = RequestFactory().post("/")
+        self.assertEqual(self.route(request), ("default", "default"))
+        self.assertIn(middleware.PIN_COOKIE, self.response.cookies)
+
+    def test_safe_get_reads_one_replica(self):
+        read, write = self.route(RequestFactory().get("/"))
+        self.assertIn(read, ["replica1", "replica2"])
+        self.assertEqual(write, "default")
+        self.assertEqual(self.route(RequestFactory().get("/"), Job)[0], "default")
+
+    def test_pin_cookie_reads_primary(self):
+        factory = RequestFactory()
+        factory.cookies[middleware.PIN_COOKIE] = "1"
+        self.assertEqual(self.route(factory.get("/")), ("default", "default"))
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user("owner", "owner@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def edit_icon(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("edit_profile", args=[self.user.id]),
+                {"icon": upload, "username": "owner", "profile": "hi"},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+
+    def test_uploading_the_same_icon_again_adds_no_reference(self):
+        self.edit_icon(image_upload("a.png"))
+        name = self.user.icon.name
+        self.edit_icon(image_upload("b.png"))
+        self.assertEqual(self.user.icon.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
+        self.edit_icon(image_upload("c.png", color="blue"))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(self.user.icon.storage.exists(name))
+
+    def create_post(self, img):
+        return Post.objects.create(user=self.user, img=img)
+
+    def delete(self, obj):
+        # django_cleanup deletes files once the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.delete()
+
+    def test_shared_upload_is_removed_with_its_last_reference(self):
+        first = self.create_post(image_upload("a.png"))
+        second = self.create_post(image_upload("b.png"))
+        name = first.img.name
+        self.assertEqual(second.img.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+        storage = first.img.storage
+        self.delete(first)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
+        self.delete(second)
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_variants_stay_while_the_original_is_referenced(self):
+        first = self.create_post(image_upload("a.png"))
+        second = self.create_post(image_upload("b.png"))
+        images.generate_post_variants(first)
+        storage = first.img.storage
+        variants = [
+            v for v in images.variant_names(first.img.name) if storage.exists(v)
+        ]
+        self.assertTrue(variants)
+        self.delete(first)
+        self.assertTrue(all(storage.exists(v) for v in variants))
+        self.delete(second)
+        self.assertFalse(any(storage.exists(v) for v in variants))
+
+    def test_legacy_flat_name_is_deleted_without_a_reference(self):
+        storage = Post._meta.get_field("img").storage
+        name = "posts/legacy.png"
+        path = storage.path(name)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(image_upload().read())
+        post = self.create_post(name)
+        self.delete(post)
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+
+class ExplicitDatesTests(TestCase):
+    def test_overlapping_blocks_restore_the_flags(self):
+        field = Post._meta.get_field("post_date")
+        entered, first_done = threading.Event(), threading.Event()
+        seen = []
+
+        def second():
+            with seeding.explicit_dates(Post, "post_date"):
+                entered.set()
+                first_done.wait()
+                seen.append(field.auto_now_add)
+
+        thread = threading.Thread(target=second)
+        with seeding.explicit_dates(Post, "post_date"):
+            thread.start()
+            entered.wait()
+        first_done.set()
+        thread.join()
+        # Off until the last block exits, then back on.
+        self.assertEqual(seen, [False])
+        self.assertTrue(field.auto_now_add)
+        self.assertFalse(field.auto_now)
+
+
+# Import workers are threads here: forked processes would not see the
+# in-memory test database.
+@mock.patch.object(transfer, "ProcessPoolExecutor", ThreadPoolExecutor)
+class TransferTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        users = [
+            User.objects.create_user(f"user{i}", f"user{i}@example.com", "pw")
+            for i in range(4)
+        ]
+        for user in users:
+            user.follow.add(*(other for other in users if other != user))
+            for i in range(3):
+                post = Post.objects.create(user=user, img=f"posts/{user.id}-{i}.jpg")
+                timeline.fan_out(post)
+        for user in users:
+            for post in Post.objects.exclude(user=user)[: user.id]:
+                likes.set_like(user, post.id, True)
+        likes.set_like(users[0], post.id, False)
+        TrendingEpoch.objects.update(epoch=F("epoch") - timedelta(hours=1))
+        self.snapshot = self.take_snapshot()
+        transfer.export_to(self.directory)
+        User.objects.all().delete()
+        TrendingEpoch.objects.update(epoch=timezone.now())
+
+    def take_snapshot(self):
+        Follow, Like = User.follow.through, User.like.through
+        return {
+            "users": list(User.objects.order_by("pk").values_list("pk", "username")),
+            "posts": list(
+                Post.objects.order_by("pk").values_list(
+                    "pk", "user_id", "post_date", "like_count", "trending_score"
+                )
+            ),
+            "follows": sorted(Follow.objects.values_list("from_user_id", "to_user_id")),
+            "likes": sorted(Like.objects.values_list("user_id", "post_id")),
+            "like_events": list(
+                LikeEvent.objects.order_by("pk").values_list(
+                    "pk", "user_id", "post_id", "liked", "created_at"
+                )
+            ),
+            "timeline": TimelineEntry.objects.count(),
+            "epoch": TrendingEpoch.objects.get().epoch,
+        }
+
+    def import_from(self):
+        transfer.import_from(
+            self.directory, batch_size=5, workers=2, stdout=io.StringIO()
+        )
+
+    def test_round_trip(self):
+        self.import_from()
+        self.assertEqual(self.take_snapshot(), self.snapshot)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory, transfer.CHECKPOINT))
+        )
+
+    def test_interrupted_import_resumes(self):
+        import_chunk = transfer.import_chunk
+        imported = []
+
+        def fail_on_likes(section, *args):
+            if section == "likes":
+                raise RuntimeError("interrupted")
+            return import_chunk(section, *args)
+
+        def record(section, *args):
+            imported.append(section)
+            return import_chunk(section, *args)
+
+        with mock.patch.object(transfer, "import_chunk", fail_on_likes):
+            with self.assertRaises(RuntimeError):
+                self.import_from()
+        with mock.patch.object(transfer, "import_chunk", record):
+            self.import_from()
+        self.assertEqual(set(imported), {"likes", "like_events"})
+        self.assertEqual(self.take_snapshot(), self.snapshot)
+
+
+class MediaViewTests(TestCase):
+    CONTENT = bytes(range(100))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addressed = "posts/ab/cd/abcd" + "0" * 60 + ".jpg"
+        self.plain = "posts/plain.jpg"
+        for name in (self.addressed, self.plain):
+            path = os.path.join(media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self.CONTENT)
+        self.mtime = int(os.stat(path).st_mtime)
+
+    def get(self, path, **headers):
+        request = RequestFactory().get(f"/media/{path}", headers=headers)
+        response = MediaView.as_view()(request, path=path)
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def test_cache_headers(self):
+        response = self.get(self.addressed)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.content(response), self.CONTENT)
+        response = self.get(self.plain)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Last-Modified"], http_date(self.mtime))
+
+    def test_not_modified(self):
+        response = self.get(self.plain, If_Modified_Since=http_date(self.mtime))
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        for header, status, body in (
+            ("bytes=10-19", 206, self.CONTENT[10:20]),
+            ("bytes=90-", 206, self.CONTENT[90:]),
+            ("bytes=-5", 206, self.CONTENT[95:]),
+            ("bytes=95-200", 206, self.CONTENT[95:]),
+            # Invalid ranges are ignored.
+            ("bytes=5-3", 200, self.CONTENT),
+            ("bytes=a-b", 200, self.CONTENT),
+            ("bytes=0-1,5-6", 200, self.CONTENT),
+            # Valid but past the end.
+            ("bytes=100-", 416, b""),
+        ):
+            with self.subTest(header=header):
+                response = self.get(self.plain, Range=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(self.content(response), body)
+        response = self.get(self.plain, Range="bytes=10-19")
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        response = self.get(self.plain, Range="bytes=100-")
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_if_range(self):
+        response = self.get(
+            self.plain, Range="bytes=0-9", If_Range=http_date(self.mtime)
+        )
+        self.assertEqual(response.status_code, 206)
+        response = self.get(
+            self.plain, Range="bytes=0-9", If_Range=http_date(self.mtime - 60)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.CONTENT)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("viewer", "viewer@example.com", "pw")
+        cls.post = Post.objects.create(user=cls.user, img="posts/p.jpg")
+        timeline.fan_out(cls.post)
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client.force_login(self.user)
+
+    def assert_revalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        likes.toggle_like(self.user, self.post.id)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_post_detail(self):
+        self.assert_revalidates(reverse("post_detail", args=[self.post.id]))
+
+    def test_feed_api(self):
+        url = reverse("home_api")
+        self.assert_revalidates(url)
+        self.assert_revalidates(url + "?follow")
+        etag = self.client.get(url)["ETag"]
+        Post.objects.create(user=self.user, img="posts/new.jpg")
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["posts"]), 2)
+
+
+# The async views, which main.urls only routes with ASYNC_VIEWS set.
+urlpatterns = [
+    path("home/", views.AsyncPostListView.as_view()),
+    path("search/", views.AsyncSearchView.as_view()),
+    path("like/<int:id>", views.AsyncPostLikeAPIView.as_view()),
+    path("", include("beengram.urls")),
+]
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(name, f"{name}@example.com", "password")
+            for name in ("alice", "bobby")
+        ]
+        cls.alice.follow.add(cls.bob)
+        for i in range(PostListView.paginate_by + 5):
+            post = Post.objects.create(
+                user=(cls.alice, cls.bob)[i % 2], img="posts/p.jpg", note=f"note {i}"
+            )
+            timeline.fan_out(post)
+            if i % 3 == 0:
+                likes.set_like(cls.alice, post.id, True)
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client.force_login(self.alice)
+
+    def get(self, url, params, asynchronous):
+        urlconf = __name__ if asynchronous else "beengram.urls"
+        with override_settings(ROOT_URLCONF=urlconf):
+            response = self.client.get(url, params)
+            # Resolved lazily, so only while the URLconf is still in place.
+            view_class = response.resolver_match.func.view_class
+        self.assertEqual(view_class.__name__.startswith("Async"), asynchronous)
+        return response
+
+    def page(self, url, params, asynchronous):
+        response = self.get(url, params, asynchronous)
+        self.assertEqual(response.status_code, 200)
+        page = response.context["page_obj"]
+        posts = [
+            (obj.id, getattr(obj, "is_liked", None), getattr(obj, "is_follow", None))
+            for obj in page.object_list
+        ]
+        return posts, getattr(page, "next_cursor", None)
+
+    def assert_same_page(self, url, params):
+        sync = self.page(url, params, False)
+        caches["default"].clear()
+        self.assertEqual(self.page(url, params, True), sync)
+        # And from the cache the first request filled.
+        self.assertEqual(self.page(url, params, True), sync)
+        return sync
+
+    def test_feeds_match_the_sync_views(self):
+        for feed in ({}, {"follow": ""}, {"trending": ""}):
+            with self.subTest(feed=feed):
+                posts, cursor = self.assert_same_page("/home/", feed)
+                self.assertTrue(posts)
+                if cursor:
+                    self.assert_same_page("/home/", {**feed, "cursor": cursor})
+        for asynchronous in (False, True):
+            response = self.get("/home/", {"cursor": "garbage"}, asynchronous)
+            self.assertEqual(response.status_code, 404)
+
+    def test_search_matches_the_sync_view(self):
+        self.assert_same_page("/search/", {"keyword": "bob"})
+        for order in ("date", "rank"):
+            self.assert_same_page(
+                "/search/", {"post": "", "keyword": "note 1", "order": order}
+            )
+
+    def test_like_api(self):
+        post = Post.objects.filter(user=self.bob).latest("id")
+        response = self.get(f"/like/{post.id}", {}, True)
+        self.assertEqual(response.status_code, 405)
+        with override_settings(ROOT_URLCONF=__name__):
+            response = self.client.post(f"/like/{post.id}", {"state": "1"})
+        self.assertEqual(response.json()["liked"], True)
+        self.assertTrue(post.liked_users.filter(pk=self.alice.pk).exists())
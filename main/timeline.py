@@ -0,0 +1,96 @@
+"""
+Materialized follow timeline.
+
+Every user owns one ``TimelineEntry`` per post that belongs in their follow
+feed (their own posts and the posts of everyone they follow), so the feed is
+a single range read on ``(owner, post_date, post)`` instead of a union over
+the follow graph.
+"""
+
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import feedcache
+from .models import Post, TimelineEntry, User
+
+BATCH_SIZE = 1000
+
+Follow = User.follow.through
+
+
+def _bulk_insert(entries, batch_size=BATCH_SIZE):
+    entries = iter(entries)
+    while batch := list(islice(entries, batch_size)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    # The entries outlive any cache, so the followers are read from the
+    # database rather than from main.followgraph.
+    follower_ids = Follow.objects.filter(to_user_id=post.user_id).values_list(
+        "from_user_id", flat=True
+    )
+    owner_ids = [post.user_id, *follower_ids]
+    _bulk_insert(
+        TimelineEntry(owner_id=owner_id, post_id=post.id, post_date=post.post_date)
+        for owner_id in owner_ids
+    )
+    feedcache.invalidate_follow(owner_ids)
+
+
+def backfill(owner_ids, followee_ids):
+    owner_ids = list(owner_ids)
+    posts = (
+        Post.objects.filter(user_id__in=followee_ids)
+        .values_list("id", "post_date")
+        .iterator()
+    )
+    _bulk_insert(
+        TimelineEntry(owner_id=owner_id, post_id=post_id, post_date=post_date)
+        for post_id, post_date in posts
+        for owner_id in owner_ids
+    )
+    feedcache.invalidate_follow(owner_ids)
+
+
+def prune(owner_ids, followee_ids):
+    owner_ids = list(owner_ids)
+    TimelineEntry.objects.filter(
+        owner_id__in=owner_ids, post__user_id__in=followee_ids
+    ).exclude(post__user_id=F("owner_id")).delete()
+    feedcache.invalidate_follow(owner_ids)
+
+
+def rebuild(owner_id, batch_size=BATCH_SIZE):
+    followees = Follow.objects.filter(from_user_id=owner_id).values("to_user_id")
+    posts = (
+        Post.objects.filter(Q(user_id=owner_id) | Q(user_id__in=followees))
+        .values_list("id", "post_date")
+        .iterator(chunk_size=batch_size)
+    )
+    with transaction.atomic():
+        TimelineEntry.objects.filter(owner_id=owner_id).delete()
+        _bulk_insert(
+            (
+                TimelineEntry(owner_id=owner_id, post_id=post_id, post_date=post_date)
+                for post_id, post_date in posts
+            ),
+            batch_size,
+        )
+    feedcache.invalidate_follow([owner_id])
+
+
+def hydrate(post_ids, queryset=None):
+    if queryset is None:
+        queryset = Post.objects.all()
+    posts = queryset.in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+async def ahydrate(post_ids, queryset=None):
+    if queryset is None:
+        queryset = Post.objects.all()
+    posts = await queryset.ain_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
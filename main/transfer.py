@@ -0,0 +1,315 @@
+"""
+Streaming export and import of users, posts, follows and likes.
+
+An export is a directory with one JSON object per line and table
+(``users.jsonl``, ``posts.jsonl``, ``follows.jsonl``, ``likes.jsonl``,
+``like_events.jsonl``), a ``manifest.json`` and optionally ``media.tar`` with the files that
+``Post.img`` and ``User.icon`` refer to, including their variants. Rows are
+read with ``iterator()`` and written line by line, so memory stays constant
+however large the tables are. Follows and likes are capped at the largest
+user and post id seen when the export started, so that rows created while
+it runs never refer to a user or post the export lacks. ``Post.trending_score``
+is relative to the trending epoch, which the manifest carries along with the
+like events, so imported scores and unlikes of imported likes keep their
+weight, see ``main.trending``.
+
+The import cuts each file into chunks of ``batch_size`` lines and hands them
+to a process pool, where each chunk is parsed and written with one
+``bulk_create(ignore_conflicts=True)``. Completed chunks are recorded in a
+checkpoint file next to the export, so an interrupted import resumes with
+the chunks it has not done yet; redoing a chunk is harmless, since rows
+keep their primary keys. Derived data (timelines, search indexes, media
+references) is rebuilt once at the end, see ``main.seeding``.
+"""
+
+import json
+import os
+import tarfile
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import images, seeding, trending
+from .db import retry_on_locked
+from .models import LikeEvent, Post, TrendingEpoch, User
+from .storage import is_addressed
+
+VERSION = 2
+BATCH_SIZE = 2000
+MANIFEST = "manifest.json"
+MEDIA = "media.tar"
+CHECKPOINT = ".import-checkpoint.json"
+
+Follow = User.follow.through
+Like = User.like.through
+
+# Imported in this order, so that every row's foreign keys already exist.
+SECTIONS = ("users", "posts", "follows", "likes", "like_events")
+MODELS = {
+    "users": User,
+    "posts": Post,
+    "follows": Follow,
+    "likes": Like,
+    "like_events": LikeEvent,
+}
+# Fields holding storage names that a media import may have to rename.
+MEDIA_FIELDS = {"users": "icon", "posts": "img"}
+
+
+def _fields(section):
+    model = MODELS[section]
+    if section in ("follows", "likes"):
+        # The pair is unique; the surrogate id is not worth keeping.
+        return [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+    return [f.attname for f in model._meta.concrete_fields]
+
+
+def _querysets(max_user, max_post, max_event):
+    return {
+        "users": User.objects.filter(pk__lte=max_user),
+        "posts": Post.objects.filter(pk__lte=max_post, user_id__lte=max_user),
+        "follows": Follow.objects.filter(
+            from_user_id__lte=max_user, to_user_id__lte=max_user
+        ),
+        "likes": Like.objects.filter(user_id__lte=max_user, post_id__lte=max_post),
+        "like_events": LikeEvent.objects.filter(
+            pk__lte=max_event, user_id__lte=max_user, post_id__lte=max_post
+        ),
+    }
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts datetimes to milliseconds, which would
+        # reorder posts within the same millisecond.
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _log(stdout, message):
+    if stdout is not None:
+        stdout.write(message)
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def export_to(directory, media=False, chunk_size=BATCH_SIZE, stdout=None):
+    os.makedirs(directory, exist_ok=True)
+    max_user = User.objects.aggregate(max=Max("pk"))["max"] or 0
+    max_post = Post.objects.aggregate(max=Max("pk"))["max"] or 0
+    max_event = LikeEvent.objects.aggregate(max=Max("pk"))["max"] or 0
+    querysets = _querysets(max_user, max_post, max_event)
+    manifest = {
+        "version": VERSION,
+        "created": timezone.now().isoformat(),
+        "trending_epoch": trending.get_epoch().isoformat(),
+        "sections": {},
+        "media": None,
+    }
+    for section in SECTIONS:
+        filename = f"{section}.jsonl"
+        rows = (
+            querysets[section]
+            .order_by("pk")
+            .values(*_fields(section))
+            .iterator(chunk_size=chunk_size)
+        )
+        count = 0
+        with open(os.path.join(directory, filename), "w") as f:
+            for row in rows:
+                f.write(json.dumps(row, cls=_Encoder, ensure_ascii=False))
+                f.write("\n")
+                count += 1
+        manifest["sections"][section] = {"file": filename, "count": count}
+        _log(stdout, f"Exported {count} {section}.")
+    if media:
+        names = _media_names(querysets, chunk_size)
+        count = export_media(os.path.join(directory, MEDIA), names)
+        manifest["media"] = MEDIA
+        _log(stdout, f"Exported {count} media files.")
+    _write_json(os.path.join(directory, MANIFEST), manifest)
+    return manifest
+
+
+def _media_names(querysets, chunk_size):
+    for section, field in MEDIA_FIELDS.items():
+        yield from (
+            querysets[section]
+            .exclude(**{field: ""})
+            .values_list(field, flat=True)
+            .distinct()
+            .order_by()
+            .iterator(chunk_size=chunk_size)
+        )
+
+
+def export_media(path, names, storage=default_storage):
+    count = 0
+    with tarfile.open(path, "w") as tar:
+        for name in names:
+            if not storage.exists(name):
+                continue
+            # Content-addressed originals may be shared by many rows; their
+            # variants are only written once per original.
+            for member in [name, *images.variant_names(name)]:
+                if member != name and not storage.exists(member):
+                    continue
+                info = tarfile.TarInfo(member)
+                info.size = storage.size(member)
+                info.mtime = int(storage.get_modified_time(member).timestamp())
+                with storage.open(member, "rb") as f:
+                    tar.addfile(info, f)
+                count += 1
+    return count
+
+
+def import_media(path, storage=default_storage):
+    """
+    Store the files of a media archive; return ``{old: new}`` for files that
+    the storage saved under a different name.
+    """
+    renamed = {}
+    with tarfile.open(path, "r") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            name = member.name
+            # Addressed names are kept verbatim; existing ones are already
+            # complete, since the storage writes files atomically.
+            if is_addressed(name) and storage.exists(name):
+                continue
+            saved = storage.save(name, File(tar.extractfile(member), name=name))
+            if saved != name:
+                renamed[name] = saved
+    return renamed
+
+
+def _chunks(path, batch_size):
+    """Yield ``(start, end)`` byte offsets of every ``batch_size`` lines."""
+    with open(path, "rb") as f:
+        start = f.tell()
+        lines = 0
+        for line in iter(f.readline, b""):
+            lines += 1
+            if lines == batch_size:
+                end = f.tell()
+                yield start, end
+                start, lines = end, 0
+        if lines:
+            yield start, f.tell()
+
+
+@retry_on_locked
+def _bulk_create(model, objects):
+    with transaction.atomic():
+        if model is Post:
+            with seeding.explicit_dates(Post, "post_date", "updated_at"):
+                model.objects.bulk_create(objects, ignore_conflicts=True)
+        else:
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+
+
+def import_chunk(section, path, start, end, renamed):
+    model = MODELS[section]
+    media_field = MEDIA_FIELDS.get(section)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    objects = []
+    for line in data.splitlines():
+        row = json.loads(line)
+        if media_field and row.get(media_field) in renamed:
+            row[media_field] = renamed[row[media_field]]
+        objects.append(model(**row))
+    _bulk_create(model, objects)
+    return start, len(objects)
+
+
+def import_from(
+    directory, batch_size=BATCH_SIZE, workers=None, restart=False, stdout=None
+):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != VERSION:
+        raise ValueError(f"Unsupported export version {manifest.get('version')}.")
+
+    checkpoint_path = os.path.join(directory, CHECKPOINT)
+    checkpoint = {"created": manifest["created"], "batch_size": batch_size}
+    if not restart and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            previous = json.load(f)
+        if previous.get("created") != manifest["created"]:
+            raise ValueError("The checkpoint belongs to another export.")
+        if previous.get("batch_size") != batch_size:
+            raise ValueError(f"Resume with --batch-size {previous['batch_size']}.")
+        checkpoint = previous
+        _log(stdout, "Resuming the previous import.")
+    checkpoint.setdefault("done", {})
+
+    renamed = checkpoint.get("renamed", {})
+    if manifest["media"] and not checkpoint.get("media_done"):
+        renamed = import_media(os.path.join(directory, manifest["media"]))
+        checkpoint.update(renamed=renamed, media_done=True)
+        _write_json(checkpoint_path, checkpoint)
+        _log(stdout, f"Imported media files, {len(renamed)} renamed.")
+
+    # Forked workers must not share the parent's database connections; the
+    # parent does not query again until the pool is done.
+    connections.close_all()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        for section in SECTIONS:
+            path = os.path.join(directory, manifest["sections"][section]["file"])
+            done = set(checkpoint["done"].setdefault(section, []))
+            count = 0
+            pending = set()
+            for start, end in _chunks(path, batch_size):
+                if start in done:
+                    continue
+                # Bounded, so the queued chunks stay small in memory.
+                if len(pending) >= workers * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    count += _record(checkpoint, checkpoint_path, section, finished)
+                pending.add(
+                    pool.submit(import_chunk, section, path, start, end, renamed)
+                )
+            count += _record(checkpoint, checkpoint_path, section, wait(pending)[0])
+            _log(stdout, f"Imported {count} {section}.")
+
+    # Explicit primary keys leave the sequences behind on other databases.
+    with connection.cursor() as cursor:
+        models = [User, Post, LikeEvent]
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+    # The imported scores are relative to the exporting database's epoch.
+    TrendingEpoch.objects.update_or_create(
+        pk=trending.EPOCH_PK,
+        defaults={"epoch": parse_datetime(manifest["trending_epoch"])},
+    )
+    seeding.rebuild_derived(stdout)
+    os.remove(checkpoint_path)
+    return manifest
+
+
+def _record(checkpoint, path, section, futures):
+    count = 0
+    for future in futures:
+        start, rows = future.result()
+        checkpoint["done"][section].append(start)
+        count += rows
+    _write_json(path, checkpoint)
+    return count
@@ -0,0 +1,171 @@
+"""
+Trending posts by exponentially decayed like counts.
+
+A like at time ``t`` is worth ``2 ** (-(now - t) / TRENDING_HALF_LIFE)``.
+Decaying every score as time passes would rewrite every row, so scores use
+forward decay instead: ``Post.trending_score`` is the sum of
+``exp((t - epoch) / tau)`` over its likes, relative to a fixed epoch kept in
+``TrendingEpoch``. Scores then only change when a post is liked or unliked,
+their order is the order of the decayed scores at any time, and the feed is
+a top-K read of the ``(-trending_score, -id)`` index. An unlike takes back
+the weight of the latest like of that pair, found in the ``LikeEvent`` log.
+
+The weights of new likes grow with time, so ``compact()``, run periodically
+by the ``compact_trending`` job, rescales all scores to a new epoch of now,
+clears the ones that decayed to nothing and prunes old events. Without a
+worker the weights would eventually overflow, so ``get_epoch()`` also
+compacts when the epoch is ``MAX_EPOCH_AGE`` half-lives old.
+"""
+
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Case, F, Max, Subquery, Value, When
+from django.utils import timezone
+
+from .models import LikeEvent, Post, TrendingEpoch
+
+EPOCH_PK = 1
+# Scores below this, in likes as of the epoch, are cleared by compaction.
+EPSILON = 1e-6
+# Half-lives after which the epoch is compacted on use; floats overflow at
+# about 1024.
+MAX_EPOCH_AGE = 64
+
+
+def half_life():
+    return getattr(settings, "TRENDING_HALF_LIFE", 6 * 3600)
+
+
+def log_weight(at, epoch):
+    return (at - epoch).total_seconds() * math.log(2) / half_life()
+
+
+def weight(at, epoch):
+    """The score of a like at ``at`` relative to ``epoch``."""
+    return math.exp(log_weight(at, epoch))
+
+
+def _read_epoch(using):
+    # The row is created by the migration; get_or_create() only covers a
+    # deleted row.
+    epoch, _ = TrendingEpoch.objects.using(using).get_or_create(
+        pk=EPOCH_PK, defaults={"epoch": timezone.now()}
+    )
+    return epoch.epoch
+
+
+def get_epoch(using=None, now=None):
+    """The current epoch, compacting first if it is too old to weigh likes."""
+    now = now or timezone.now()
+    epoch = _read_epoch(using)
+    if log_weight(now, epoch) > MAX_EPOCH_AGE * math.log(2):
+        compact(now)
+        epoch = now
+    return epoch
+
+
+def unlike_weights(using, user_id, post_ids, epoch):
+    """
+    Return ``{post_id: score}`` that unliking ``post_ids`` takes back.
+
+    Likes older than the event log take nothing back; their weight has
+    decayed to nothing by the time their events are pruned.
+    """
+    latest = (
+        LikeEvent.objects.using(using)
+        .filter(user_id=user_id, post_id__in=post_ids, liked=True)
+        .values("post_id")
+        .annotate(at=Max("created_at"))
+        .values_list("post_id", "at")
+    )
+    return {post_id: weight(at, epoch) for post_id, at in latest}
+
+
+def per_post(values):
+    """
+    A value for ``update()`` that is ``values[id]`` for each post ``id``; the
+    updated rows must all be in ``values``.
+    """
+    distinct = set(values.values())
+    if len(distinct) == 1:
+        return distinct.pop()
+    return Case(
+        *(When(id=post_id, then=Value(value)) for post_id, value in values.items())
+    )
+
+
+def log_events(using, user_id, added, removed, now):
+    LikeEvent.objects.using(using).bulk_create(
+        [
+            LikeEvent(user_id=user_id, post_id=post_id, liked=liked, created_at=now)
+            for post_ids, liked in ((added, True), (removed, False))
+            for post_id in post_ids
+        ]
+    )
+
+
+def _top_queryset(queryset, size):
+    epoch = TrendingEpoch.objects.filter(pk=EPOCH_PK).values("epoch")
+    return (
+        queryset.filter(trending_score__gt=0)
+        .annotate(trending_epoch=Subquery(epoch))
+        .order_by("-trending_score", "-id")[:size]
+    )
+
+
+def _still_trending(posts):
+    # The index orders by score, so dropping the decayed tail is the same
+    # as filtering by the decayed score first.
+    now = timezone.now()
+    threshold = getattr(settings, "TRENDING_MIN_SCORE", 0.1)
+    floor = math.log(threshold) if threshold > 0 else -math.inf
+    # Compared as logarithms, which do not overflow however old the epoch.
+    return [
+        post
+        for post in posts
+        if post.trending_epoch is not None
+        and math.log(post.trending_score)
+        >= floor + log_weight(now, post.trending_epoch)
+    ]
+
+
+def top(queryset, size):
+    """The ``size`` highest scored posts of ``queryset`` that still trend."""
+    return _still_trending(_top_queryset(queryset, size))
+
+
+async def atop(queryset, size):
+    return _still_trending([post async for post in _top_queryset(queryset, size)])
+
+
+def compact(now=None):
+    """
+    Rescale every score to an epoch of ``now`` and prune old like events.
+
+    Returns ``(rescaled, cleared, pruned)`` row counts.
+    """
+    now = now or timezone.now()
+    using = router.db_for_write(Post)
+    with transaction.atomic(using=using):
+        factor = math.exp(-log_weight(now, _read_epoch(using)))
+        posts = Post.objects.using(using)
+        rescaled = posts.filter(trending_score__gt=0).update(
+            trending_score=F("trending_score") * factor
+        )
+        # Unlikes may leave rounding errors behind, on either side of zero.
+        cleared = (
+            posts.filter(trending_score__lt=EPSILON)
+            .exclude(trending_score=0)
+            .update(trending_score=0)
+        )
+        TrendingEpoch.objects.using(using).filter(pk=EPOCH_PK).update(epoch=now)
+    retention = getattr(settings, "TRENDING_EVENT_RETENTION", 14 * 86400)
+    pruned, _ = (
+        LikeEvent.objects.using(router.db_for_write(LikeEvent))
+        .filter(created_at__lt=now - timedelta(seconds=retention))
+        .delete()
+    )
+    return rescaled, cleared, pruned
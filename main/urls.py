@@ -1,32 +1,64 @@
 import django.contrib.auth.views as auth_views
+from django.conf import settings
 from django.urls import path
 from django.views.generic import TemplateView
 
 from . import views
+from .querycheck import query_budget
 
+if getattr(settings, "ASYNC_VIEWS", False):
+    PostListView = views.AsyncPostListView
+    SearchView = views.AsyncSearchView
+    PostLikeAPIView = views.AsyncPostLikeAPIView
+else:
+    PostListView = views.PostListView
+    SearchView = views.SearchView
+    PostLikeAPIView = views.PostLikeAPIView
+
+# The second argument of query_budget() is the most queries a request may
+# run, including the session and user lookups, see main.querycheck.
 urlpatterns = [
-    path("", TemplateView.as_view(template_name="main/index.html"), name="index"),
-    path("home/", views.PostListView.as_view(), name="home"),
+    path(
+        "",
+        query_budget(TemplateView.as_view(template_name="main/index.html"), 2),
+        name="index",
+    ),
+    path("home/", query_budget(PostListView.as_view(), 4), name="home"),
+    path("home.json", query_budget(views.FeedAPIView.as_view(), 4), name="home_api"),
     path(
         "settings/",
-        TemplateView.as_view(template_name="main/settings.html"),
+        query_budget(views.SettingsView.as_view(), 3),
         name="settings",
     ),
-    path("login/", auth_views.LoginView.as_view(), name="login"),
-    path("logout/", auth_views.LogoutView.as_view(), name="logout"),
-    path("signup/", views.SignUpView.as_view(), name="signup"),
-    path("post/<int:id>", views.PostDetailView.as_view(), name="post_detail"),
-    path("post/", views.PostView.as_view(), name="new_post"),
+    path("login/", query_budget(auth_views.LoginView.as_view(), 5), name="login"),
+    path("logout/", query_budget(auth_views.LogoutView.as_view(), 4), name="logout"),
+    path("signup/", query_budget(views.SignUpView.as_view(), 11), name="signup"),
+    path(
+        "post/<int:id>",
+        query_budget(views.PostDetailView.as_view(), 3),
+        name="post_detail",
+    ),
+    path("post/", query_budget(views.PostView.as_view(), 13), name="new_post"),
     path(
         "delete_post/<int:id>",
-        views.PostDeleteView.as_view(),
+        query_budget(views.PostDeleteView.as_view(), 9),
         name="delete_post",
     ),
     path(
         "edit_profile/<int:id>",
-        views.ProfileEditView.as_view(),
+        query_budget(views.ProfileEditView.as_view(), 13),
         name="edit_profile",
     ),
-    path("search/", views.SearchView.as_view(), name="search"),
-    path("like/<int:id>", views.PostLikeAPIView.as_view(), name="like"),
+    path("search/", query_budget(SearchView.as_view(), 5), name="search"),
+    path(
+        "search/users.json",
+        query_budget(views.UserTypeaheadAPIView.as_view(), 4),
+        name="user_typeahead",
+    ),
+    path("like/<int:id>", query_budget(PostLikeAPIView.as_view(), 7), name="like"),
+    path(
+        "like/batch",
+        query_budget(views.PostLikeBatchAPIView.as_view(), 10),
+        name="like_batch",
+    ),
 ]
@@ -0,0 +1,89 @@
+"""
+Username search backed by an n-gram index.
+
+Each user's lower-cased username is split into every 3-gram plus the two
+shorter tail grams, so any substring of up to three characters is a prefix
+of some stored gram. Longer keywords must contain all of their 3-grams.
+Both lookups are index range reads on ``UsernameGram.gram``; the final
+``icontains`` only re-checks the narrowed candidates.
+"""
+
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import Length
+
+from .models import User, UsernameGram
+
+GRAM = 3
+BATCH_SIZE = 1000
+
+
+def normalize(username):
+    return username.lower()
+
+
+def username_grams(username):
+    name = normalize(username)
+    return {name[i : i + GRAM] for i in range(len(name))}
+
+
+def index_user(user):
+    with transaction.atomic():
+        UsernameGram.objects.filter(user=user).delete()
+        UsernameGram.objects.bulk_create(
+            UsernameGram(user=user, gram=gram) for gram in username_grams(user.username)
+        )
+
+
+def rebuild_index(batch_size=BATCH_SIZE):
+    users = User.objects.values_list("id", "username").iterator(chunk_size=batch_size)
+    grams = (
+        UsernameGram(user_id=user_id, gram=gram)
+        for user_id, username in users
+        for gram in username_grams(username)
+    )
+    count = 0
+    with transaction.atomic():
+        UsernameGram.objects.all().delete()
+        while batch := list(islice(grams, batch_size)):
+            UsernameGram.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def matching_user_ids(word):
+    word = normalize(word)
+    if len(word) < GRAM:
+        return UsernameGram.objects.filter(
+            gram__gte=word, gram__lt=word + "\U0010ffff"
+        ).values("user_id")
+    needed = {word[i : i + GRAM] for i in range(len(word) - GRAM + 1)}
+    return (
+        UsernameGram.objects.filter(gram__in=needed)
+        .values("user_id")
+        .annotate(found=Count("gram"))
+        .filter(found=len(needed))
+        .values("user_id")
+    )
+
+
+def search_users(queryset, keyword):
+    for word in keyword.split():
+        queryset = queryset.filter(
+            id__in=matching_user_ids(word), username__icontains=word
+        )
+    return queryset
+
+
+def typeahead(queryset, prefix, limit):
+    queryset = search_users(queryset, prefix)
+    return queryset.annotate(
+        is_prefix=Case(
+            When(username__istartswith=prefix.split()[0], then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ),
+        name_length=Length("username"),
+    ).order_by("is_prefix", "name_length", "username")[:limit]
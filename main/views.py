@@ -1,40 +1,335 @@
+import hashlib
+import json
+import mimetypes
+import os
+from contextlib import contextmanager, nullcontext
+from stat import S_ISREG
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model, login
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Case, Q, When
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.paginator import InvalidPage
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Exists, OuterRef
 from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
     HttpResponseRedirect,
     JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
 )
-from django.urls import reverse_lazy
-from django.views.generic.base import View
+from django.utils._os import safe_join
+from django.utils.http import http_date, quote_etag
+from django.views.generic.base import TemplateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
 
+from . import (
+    feedcache,
+    followgraph,
+    fragments,
+    likes,
+    routers,
+    search,
+    suggestions,
+    timeline,
+    trending,
+    usersearch,
+)
 from .forms import (
     ConfirmForm,
     PostForm,
+    PostSearchForm,
     ProfileEditForm,
     SearchForm,
     SignUpForm,
 )
-from .models import Post
+from .models import Post, TimelineEntry
+from .pagination import CursorPage, CursorPaginator, InvalidCursor
+from .storage import is_addressed
 
 User = get_user_model()
 
 
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """``LoginRequiredMixin`` for views with ``async def`` handlers."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+class AsyncListMixin:
+    """
+    ``get()`` for list views that fetch their page with the async ORM.
+
+    ``apaginate_queryset()`` is awaited before the context is built and
+    ``paginate_queryset()`` returns its result, so templates only see
+    evaluated lists.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        self.pagination = await self.apaginate_queryset(self.object_list, page_size)
+        return self.render_to_response(self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.pagination
+
+
+class ConditionalGetMixin:
+    """
+    Answer ``If-None-Match`` with 304 before rendering the response.
+
+    The ETag is a hash of ``get_etag_data()``, which should return everything
+    the response shows that can change without the URL changing.
+    ``get_last_modified()`` only fills in the ``Last-Modified`` header: the
+    rendered state includes authors and like flags that have no timestamp,
+    so ``If-Modified-Since`` alone is not trusted.
+    """
+
+    def get_etag_data(self, context):
+        raise NotImplementedError
+
+    def get_last_modified(self, context):
+        return None
+
+    def get_etag(self, context):
+        data = [
+            getattr(settings, "ETAG_VERSION", ""),
+            self.request.user.pk,
+            self.get_etag_data(context),
+        ]
+        digest = hashlib.md5(
+            json.dumps(data, default=str).encode(), usedforsecurity=False
+        )
+        return quote_etag(digest.hexdigest())
+
+    def render_to_response(self, context, **response_kwargs):
+        etag = self.get_etag(context)
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            response = super().render_to_response(context, **response_kwargs)
+        response.headers["ETag"] = etag
+        last_modified = self.get_last_modified(context)
+        if last_modified:
+            response.headers["Last-Modified"] = http_date(last_modified.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Cookie"])
+        return response
+
+
+class JSONResponseMixin:
+    def get_data(self, context):
+        raise NotImplementedError
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse(self.get_data(context), **response_kwargs)
+
+
 class PostListView(LoginRequiredMixin, ListView):
     model = Post
-    ordering = ("-post_date",)
+    ordering = ("-post_date", "-id")
     paginate_by = 20
+    template_name = "main/post_list.html"
+    context_object_name = "post_list"
+    cursor_kwarg = "cursor"
+    trending_size = 50
+
+    @property
+    def feed(self):
+        for feed in ("trending", "follow"):
+            if feed in self.request.GET:
+                return feed
+        return "latest"
+
+    @property
+    def is_follow_feed(self):
+        return self.feed == "follow"
+
+    @property
+    def is_trending_feed(self):
+        return self.feed == "trending"
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(feed=self.feed, **kwargs)
 
     def get_queryset(self):
-        queryset = super().get_queryset().select_related("user")
-        if "follow" in self.request.GET:
-            queryset = queryset.filter(
-                Q(user=self.request.user) | Q(user__in=self.request.user.follow.all())
+        if self.is_follow_feed:
+            return TimelineEntry.objects.filter(owner=self.request.user)
+        return (
+            super().get_queryset().select_related("user").with_liked(self.request.user)
+        )
+
+    def get_post_queryset(self):
+        return Post.objects.select_related("user").with_liked(self.request.user)
+
+    def get_feed_cache_key(self):
+        if self.is_follow_feed:
+            return feedcache.follow_key(self.request.user.pk)
+        return feedcache.LATEST_KEY
+
+    def get_cursor_paginator(self, queryset, page_size):
+        if self.is_follow_feed:
+            return CursorPaginator(queryset, page_size, id_field="post_id")
+        return CursorPaginator(queryset, page_size)
+
+    def paginate_trending(self, posts):
+        # A single page of the top posts; scores move too fast for cursors.
+        page = CursorPage(posts, None)
+        fragments.attach_versions(page.object_list)
+        return (None, page, page.object_list, False)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.is_trending_feed:
+            return self.paginate_trending(trending.top(queryset, self.trending_size))
+        paginator, cursor, cache_key = self.get_feed_paginator(queryset, page_size)
+        cached = self.get_cached_page(paginator, cache_key)
+        if cached:
+            page = cached
+            page.object_list = timeline.hydrate(
+                page.object_list, self.get_post_queryset()
+            )
+        else:
+            with self.read_page(cache_key):
+                page = paginator.page(cursor)
+                if self.is_follow_feed:
+                    page.object_list = timeline.hydrate(
+                        self.get_entry_post_ids(page), self.get_post_queryset()
+                    )
+            self.cache_page(cache_key, page)
+        return self.get_pagination(page)
+
+    # Steps shared with AsyncPostListView.apaginate_queryset(), which only
+    # differs in awaiting the queries.
+
+    def get_feed_paginator(self, queryset, page_size):
+        """Return the paginator, the cursor and the cache key of the page."""
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        # Only first pages are cached.
+        cache_key = None if cursor else self.get_feed_cache_key()
+        return paginator, cursor, cache_key
+
+    def get_cached_page(self, paginator, cache_key):
+        """A page of the cached post ids, or None."""
+        cached = feedcache.get(cache_key, paginator.per_page) if cache_key else None
+        if cached is None:
+            return None
+        post_ids, next_cursor = cached
+        return CursorPage(post_ids, paginator, next_cursor)
+
+    @contextmanager
+    def read_page(self, cache_key):
+        # A page that is going to be cached is read from the primary.
+        with routers.primary() if cache_key else nullcontext():
+            try:
+                yield
+            except InvalidCursor:
+                raise Http404("Invalid cursor.")
+
+    def get_entry_post_ids(self, page):
+        return [entry.post_id for entry in page.object_list]
+
+    def cache_page(self, cache_key, page):
+        if cache_key:
+            feedcache.store(
+                cache_key,
+                page.paginator.per_page,
+                [post.id for post in page.object_list],
+                page.next_cursor,
             )
-        return queryset
+
+    def get_pagination(self, page):
+        fragments.attach_versions(page.object_list)
+        return (page.paginator, page, page.object_list, page.has_other_pages())
+
+
+class FeedAPIView(ConditionalGetMixin, JSONResponseMixin, PostListView):
+    """A page of the home feeds as JSON, for loading more posts in place."""
+
+    def serialize_post(self, post):
+        return {
+            "id": post.id,
+            "url": reverse("post_detail", args=[post.id]),
+            "image": {
+                "src": post.img_src_url,
+                "srcset": post.img_srcset,
+                "webp_srcset": post.img_webp_srcset,
+                "sizes": post.img_sizes,
+            },
+            "note": post.note,
+            "like_count": post.like_count,
+            "liked": post.is_liked,
+            "user": {
+                "id": post.user_id,
+                "username": post.user.username,
+                "icon": post.user.icon_thumb_url,
+                "icon_srcset": post.user.icon_srcset,
+            },
+            "delete_url": (
+                reverse("delete_post", args=[post.id])
+                if post.user_id == self.request.user.pk
+                else None
+            ),
+        }
+
+    def get_etag_data(self, context):
+        # Card versions change with the post and its author; likes only
+        # update the counters, so those are part of the tag as well.
+        page = context["page_obj"]
+        return [
+            [
+                (post.id, post.card_version, post.is_liked, post.like_count)
+                for post in page.object_list
+            ],
+            page.next_cursor,
+        ]
+
+    def get_last_modified(self, context):
+        return max((post.updated_at for post in context["object_list"]), default=None)
+
+    def get_data(self, context):
+        return {
+            "posts": [self.serialize_post(post) for post in context["object_list"]],
+            "next_cursor": context["page_obj"].next_cursor,
+        }
+
+
+class AsyncPostListView(AsyncLoginRequiredMixin, AsyncListMixin, PostListView):
+    async def apaginate_queryset(self, queryset, page_size):
+        if self.is_trending_feed:
+            posts = await trending.atop(queryset, self.trending_size)
+            return self.paginate_trending(posts)
+        paginator, cursor, cache_key = self.get_feed_paginator(queryset, page_size)
+        cached = self.get_cached_page(paginator, cache_key)
+        if cached:
+            page = cached
+            page.object_list = await timeline.ahydrate(
+                page.object_list, self.get_post_queryset()
+            )
+        else:
+            with self.read_page(cache_key):
+                page = await paginator.apage(cursor)
+                if self.is_follow_feed:
+                    page.object_list = await timeline.ahydrate(
+                        self.get_entry_post_ids(page), self.get_post_queryset()
+                    )
+            self.cache_page(cache_key, page)
+        return self.get_pagination(page)
 
 
 class SignUpView(CreateView):
@@ -57,14 +352,15 @@ class PostView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy("home")
 
     def form_valid(self, form):
-        self.object = form.save(commit=False)
-        self.object.user = self.request.user
-        self.object.save()
+        form.instance.user = self.request.user
+        self.object = form.save()
+        timeline.fan_out(self.object)
         return HttpResponseRedirect(self.get_success_url())
 
 
 class PostDeleteView(LoginRequiredMixin, DeleteView):
     model = Post
+    pk_url_kwarg = "id"
     form_class = ConfirmForm
     success_url = reverse_lazy("home")
 
@@ -72,15 +368,43 @@ class PostDeleteView(LoginRequiredMixin, DeleteView):
         return super().get_queryset().filter(user=self.request.user)
 
 
-class PostDetailView(LoginRequiredMixin, DetailView):
+class PostDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Post
     pk_url_kwarg = "id"
 
     def get_queryset(self):
-        return super().get_queryset().select_related("user")
+        return (
+            super().get_queryset().select_related("user").with_liked(self.request.user)
+        )
+
+    def get_etag_data(self, context):
+        post = fragments.attach_versions([context["post"]])[0]
+        return [post.id, post.card_version, post.is_liked, post.like_count]
 
+    def get_last_modified(self, context):
+        return context["post"].updated_at
 
-class ProfileEditView(LoginRequiredMixin, UpdateView):
+
+class FollowSuggestionsMixin:
+    """Add the precomputed follow suggestions of the user to the context."""
+
+    suggestion_limit = 5
+
+    def get_context_data(self, **kwargs):
+        user = self.request.user
+        if user.is_authenticated:
+            kwargs.setdefault(
+                "follow_suggestions",
+                suggestions.for_user(user, self.suggestion_limit),
+            )
+        return super().get_context_data(**kwargs)
+
+
+class SettingsView(FollowSuggestionsMixin, TemplateView):
+    template_name = "main/settings.html"
+
+
+class ProfileEditView(LoginRequiredMixin, FollowSuggestionsMixin, UpdateView):
     template_name = "main/edit_profile.html"
     model = User
     form_class = ProfileEditForm
@@ -94,12 +418,17 @@ class SearchView(LoginRequiredMixin, ListView):
     template_name = "main/search.html"
     paginate_by = 20
 
+    def get_form_class(self):
+        if "post" in self.request.GET:
+            return PostSearchForm
+        return SearchForm
+
     def get_queryset(self):
-        form = SearchForm(self.request.GET)
+        form = self.get_form_class()(self.request.GET)
         if form.is_valid():
             keyword = form.cleaned_data["keyword"]
             if "post" in self.request.GET:
-                queryset = self._search_posts(keyword)
+                queryset = self._search_posts(keyword, form.cleaned_data["order"])
             else:
                 queryset = self._search_users(keyword)
         else:
@@ -109,44 +438,255 @@ class SearchView(LoginRequiredMixin, ListView):
                 queryset = User.objects.none()
         return queryset
 
-    def _search_posts(self, keyword):
-        queryset = Post.objects.all().select_related("user")
-
-        for word in keyword.split():
-            queryset = queryset.filter(note__icontains=word)
-        return queryset.order_by("-post_date")
+    def _search_posts(self, keyword, order):
+        queryset = (
+            Post.objects.all().select_related("user").with_liked(self.request.user)
+        )
+        return search.search_posts(queryset, keyword, order)
 
-    def _search_users(self, keyword):
-        follow_list = self.request.user.follow.all().values_list("id", flat=True)
-        queryset = User.objects.all().annotate(
-            is_follow=Case(
-                When(id__in=follow_list, then=True),
-                default=False,
-            )
+    def annotate_follow(self, queryset):
+        # A subquery rather than the cached followee ids, whose IN list would
+        # grow with the number of followees.
+        follows = User.follow.through.objects.filter(
+            from_user_id=self.request.user.pk, to_user_id=OuterRef("pk")
         )
+        return queryset.annotate(is_follow=Exists(follows))
 
-        for word in keyword.split():
-            queryset = queryset.filter(username__icontains=word)
+    def _search_users(self, keyword):
+        queryset = self.annotate_follow(User.objects.all())
+        queryset = usersearch.search_users(queryset, keyword)
         return queryset.order_by("-is_follow", "username")
 
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(
+            queryset, page_size
+        )
+        if "post" in self.request.GET:
+            page.object_list = fragments.attach_versions(list(page.object_list))
+            object_list = page.object_list
+        return (paginator, page, object_list, is_paginated)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        form_class = self.get_form_class()
         if "keyword" in self.request.GET:
-            context["form"] = SearchForm(self.request.GET)
+            context["form"] = form_class(self.request.GET)
         else:
-            context["form"] = SearchForm()
+            context["form"] = form_class()
         return context
 
 
+class AsyncSearchView(AsyncLoginRequiredMixin, AsyncListMixin, SearchView):
+    async def get(self, request, *args, **kwargs):
+        # Load what building the queryset may query for up front.
+        if "post" in request.GET:
+            for alias in {DEFAULT_DB_ALIAS, *routers.replicas()}:
+                await search.afts_available(alias)
+        return await super().get(request, *args, **kwargs)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        paginator = self.get_paginator(
+            queryset,
+            page_size,
+            orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        paginator.count = await queryset.acount()
+        page = self.kwargs.get(self.page_kwarg) or self.request.GET.get(
+            self.page_kwarg, 1
+        )
+        try:
+            page_number = paginator.num_pages if page == "last" else int(page)
+            page = paginator.page(page_number)
+        except (ValueError, InvalidPage):
+            raise Http404("Invalid page.")
+        page.object_list = [obj async for obj in page.object_list]
+        if "post" in self.request.GET:
+            fragments.attach_versions(page.object_list)
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
 class PostLikeAPIView(LoginRequiredMixin, View):
+    states = {
+        **dict.fromkeys(("1", "true", "on"), True),
+        **dict.fromkeys(("0", "false", "off"), False),
+    }
+
     def post(self, request, *args, **kwargs):
+        post_id = self.kwargs["id"]
+        state = request.POST.get("state")
+        # Anything else must not be read as an unlike.
+        if state is not None and state.lower() not in self.states:
+            return JsonResponse({"result": "BadRequest"}, status=400)
         try:
-            post = Post.objects.get(id=self.kwargs["id"])
-            if post in self.request.user.like.all():
-                self.request.user.like.remove(post)
+            if state is None:
+                liked = likes.toggle_like(request.user, post_id)
+                changed = True
             else:
-                self.request.user.like.add(post)
-            result = "success"
+                liked = self.states[state.lower()]
+                changed = likes.set_like(request.user, post_id, liked)
         except Post.DoesNotExist:
-            result = "DoesNotExist"
-        return JsonResponse({"result": result})
+            return JsonResponse({"result": "DoesNotExist"})
+        return JsonResponse({"result": "success", "liked": liked, "changed": changed})
+
+
+class AsyncPostLikeAPIView(AsyncLoginRequiredMixin, PostLikeAPIView):
+    async def post(self, request, *args, **kwargs):
+        # The like operations need a transaction, which the async ORM cannot
+        # open yet, so only this part runs in a thread.
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+
+class PostLikeBatchAPIView(LoginRequiredMixin, View):
+    max_batch_size = 100
+
+    def parse_liked(self, item):
+        # bool() would read "false" and "0" as True.
+        if not isinstance(item["liked"], bool):
+            raise TypeError("liked must be a JSON boolean.")
+        return item["liked"]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            items = json.loads(request.body)["likes"]
+            states = {int(item["id"]): self.parse_liked(item) for item in items}
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"result": "BadRequest"}, status=400)
+        if len(states) > self.max_batch_size:
+            return JsonResponse({"result": "BadRequest"}, status=400)
+
+        results, missing = likes.set_likes(request.user, states)
+        like_counts = dict(
+            Post.objects.filter(id__in=states).values_list("id", "like_count")
+        )
+        for result in results:
+            result["like_count"] = like_counts.get(result["id"], 0)
+        return JsonResponse({"result": "success", "likes": results, "missing": missing})
+
+
+class UserTypeaheadAPIView(LoginRequiredMixin, View):
+    default_limit = 10
+    max_limit = 20
+
+    def get(self, request, *args, **kwargs):
+        prefix = request.GET.get("q", "").strip()
+        try:
+            limit = min(
+                int(request.GET.get("limit", self.default_limit)), self.max_limit
+            )
+        except ValueError:
+            limit = self.default_limit
+        if not prefix or limit < 1:
+            return JsonResponse({"users": []})
+        follow_ids = followgraph.followees(request.user.pk)
+        users = usersearch.typeahead(User.objects.all(), prefix, limit)
+        return JsonResponse(
+            {
+                "users": [
+                    {
+                        "id": user.id,
+                        "username": user.username,
+                        "icon_url": user.icon_url,
+                        "is_follow": followgraph.contains(follow_ids, user.id),
+                    }
+                    for user in users
+                ]
+            }
+        )
+
+
+class MediaView(View):
+    """
+    Serve uploaded media for deployments without a front proxy.
+
+    Content-addressed files never change under their name, so they are
+    cached as immutable; other files are revalidated by modification time.
+    Single byte ranges are supported for partial and resumed downloads.
+    """
+
+    chunk_size = 64 * 1024
+    immutable_max_age = 365 * 24 * 60 * 60
+
+    def get(self, request, path):
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+            stat = os.stat(full_path)
+        except (SuspiciousFileOperation, OSError):
+            raise Http404("Media file not found.")
+        if not S_ISREG(stat.st_mode):
+            raise Http404("Media file not found.")
+        mtime = int(stat.st_mtime)
+        response = get_conditional_response(request, last_modified=mtime)
+        if response is None:
+            response = self.file_response(request, full_path, stat)
+            response.headers["Last-Modified"] = http_date(mtime)
+        if is_addressed(path):
+            patch_cache_control(
+                response, public=True, max_age=self.immutable_max_age, immutable=True
+            )
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    def file_response(self, request, full_path, stat):
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or "application/octet-stream"
+        size = stat.st_size
+        byte_range = self.get_range(request, size, int(stat.st_mtime))
+        if byte_range is False:
+            response = HttpResponse(status=416, content_type=content_type)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+        f = open(full_path, "rb")
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            start, end = byte_range
+            f.seek(start)
+            response = StreamingHttpResponse(
+                self.read_range(f, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response.headers["Content-Length"] = end - start + 1
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Accept-Ranges"] = "bytes"
+        return response
+
+    def get_range(self, request, size, mtime):
+        """
+        Return ``(start, end)`` for a satisfiable single range, False for a
+        valid but unsatisfiable one, and None to send the whole file.
+        """
+        header = request.headers.get("Range", "")
+        if not header.startswith("bytes=") or "," in header:
+            return None
+        if_range = request.headers.get("If-Range")
+        if if_range and if_range != http_date(mtime):
+            return None
+        first, _, last = header[len("bytes=") :].strip().partition("-")
+        try:
+            if first:
+                start = int(first)
+                if last and int(last) < start:
+                    # Not a valid range, so the header is ignored (RFC 9110).
+                    return None
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start, end = max(size - int(last), 0), size - 1
+        except ValueError:
+            return None
+        if start > end or start >= size:
+            return False
+        return start, end
+
+    def read_range(self, f, length):
+        with f:
+            while length > 0:
+                chunk = f.read(min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk